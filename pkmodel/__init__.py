@@ -8,6 +8,14 @@ of Parmokinetic (PK) models
 from .version_info import VERSION_INT, VERSION  # noqa
 
 # Import main classes
-from .model import Model    # noqa
+from .model import Model, CompiledModel    # noqa
 from .protocol import Protocol    # noqa
 from .solution import Solution     # noqa
+from .population import Population, PopulationSolution    # noqa
+from .sweep import Sweep    # noqa
+from .steady_state import SteadyState    # noqa
+from .superposition import Superposition    # noqa
+from .fitting import Fit    # noqa
+from .result import Result    # noqa
+from . import metrics    # noqa
+from . import stats    # noqa
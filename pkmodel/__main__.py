@@ -0,0 +1,8 @@
+#
+# python -m pkmodel runs the pkmodel command line interface
+#
+import sys
+
+from .cli import main
+
+sys.exit(main())
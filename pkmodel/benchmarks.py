@@ -0,0 +1,265 @@
+#
+# Benchmarks
+#
+# Measures the speed of the solve pipeline over a grid of problem sizes.
+#
+#   python -m pkmodel.benchmarks run -o current.json
+#   python -m pkmodel.benchmarks compare baseline.json current.json
+#
+# compare exits with status 1 if any benchmark is slower than the baseline
+# by more than the threshold.
+#
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+# Modules that importing pkmodel should not import
+HEAVY_MODULES = ('matplotlib', 'scipy', 'multiprocessing')
+
+# The problem that every benchmark case varies one parameter of
+BASE_CASE = {'compartments': 2, 'doses': 10, 'nsteps': 1000, 'tmax': 10.,
+             'route': 'iv'}
+
+# The values taken by each parameter
+VARIATIONS = {'compartments': [0, 2, 8], 'doses': [1, 10, 100],
+              'nsteps': [1000, 100000], 'tmax': [10., 1000.],
+              'route': ['iv', 'sc']}
+
+
+def import_time(repeat=5):
+    """
+    Measures the import of pkmodel in fresh interpreters.
+
+    :param repeat: number of interpreters to time
+    :returns: dictionary with the best import time in seconds and the
+    heavy modules (see HEAVY_MODULES) that the import loaded
+    """
+    code = ('import sys, time\n'
+            't = time.perf_counter()\n'
+            'import pkmodel\n'
+            't = time.perf_counter() - t\n'
+            'print(t)\n'
+            'print(" ".join(sorted({m.split(".")[0] for m in sys.modules'
+            ' if m.split(".")[0] in %r})))' % (HEAVY_MODULES,))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                stdout=subprocess.PIPE,
+                                universal_newlines=True).stdout
+        seconds, modules = (output.split('\n') + [''])[:2]
+        times.append(float(seconds))
+    return {'seconds': min(times), 'modules': modules.split()}
+
+
+def cases(full=False):
+    """
+    Returns the benchmark cases, as dictionaries of BASE_CASE parameters.
+    By default each parameter is varied on its own around BASE_CASE; with
+    full=True every combination of VARIATIONS is returned.
+    """
+    if full:
+        names = list(VARIATIONS)
+        return [dict(zip(names, values))
+                for values in itertools.product(*VARIATIONS.values())]
+    grid = [dict(BASE_CASE)]
+    for name, values in VARIATIONS.items():
+        grid += [dict(BASE_CASE, **{name: value}) for value in values
+                 if value != BASE_CASE[name]]
+    return grid
+
+
+def problem(case):
+    """
+    Returns the Model and Protocol of a benchmark case: equal peripheral
+    compartments, and evenly spaced instantaneous doses over tmax.
+    """
+    from . import Model, Protocol
+    n = case['compartments']
+    model = Model(Vc=1., Vps=[1.] * n, Qps=[1.] * n, CL=1.)
+    protocol = Protocol(
+        subcutaneous=case['route'] == 'sc',
+        dose_times=list(np.linspace(0, case['tmax'], case['doses'],
+                                    endpoint=False)),
+        instant_doses=[1.] * case['doses'])
+    return model, protocol
+
+
+def _solution(engine):
+    def setup(case):
+        from . import Solution
+        model, protocol = problem(case)
+        return lambda: Solution(model, protocol, tmax=case['tmax'],
+                                nsteps=case['nsteps'], engine=engine,
+                                cache=False).sol
+    return setup
+
+
+def _rhs(case):
+    from . import Solution
+    model, protocol = problem(case)
+    solution = Solution(model, protocol, tmax=case['tmax'],
+                        nsteps=case['nsteps'])
+    solution.compile()
+    rhs = (solution.rhs_subcutaneous if protocol.subcutaneous
+           else solution.rhs_intravenous)
+    y = np.ones(len(solution.b))
+    return lambda: rhs(0., y, 1.)
+
+
+def _dose_time_function(case):
+    _, protocol = problem(case)
+    t = np.linspace(0, case['tmax'], case['nsteps'])
+    return lambda: protocol.dose_time_function(t)
+
+
+def _plot(case):
+    from . import Solution
+    model, protocol = problem(case)
+    solution = Solution(model, protocol, tmax=case['tmax'],
+                        nsteps=case['nsteps'], engine='exact')
+    solution.sol
+
+    def draw():
+        fig = solution.plot()
+        fig.canvas.draw()
+        fig.clear()
+    return draw
+
+
+# Each benchmark sets up a case and returns the function that is timed
+BENCHMARKS = {
+    'solution_ode': _solution('ode'),
+    'solution_exact': _solution('exact'),
+    'rhs': _rhs,
+    'dose_time_function': _dose_time_function,
+    'plot': _plot,
+}
+
+
+def key(name, case):
+    """
+    Returns the name of a benchmark on a case, e.g.
+    'rhs[compartments=2,doses=10,nsteps=1000,route=iv,tmax=10.0]'.
+    """
+    return name + '[' + ','.join(
+        k + '=' + str(case[k]) for k in sorted(case)) + ']'
+
+
+def run(names=None, grid=None, repeat=3, imports=True):
+    """
+    Runs benchmarks.
+
+    :param names: benchmarks to run, keys of BENCHMARKS, default all
+    :param grid: list of cases, default cases()
+    :param repeat: number of timings of each benchmark, of which the
+    fastest is kept. Each timing runs the function enough times to take
+    at least 0.2 seconds.
+    :param imports: whether to also time import_time()
+    :returns: dictionary with the environment and, for each benchmark and
+    case, the time per call in seconds
+    """
+    names = list(BENCHMARKS) if names is None else names
+    grid = cases() if grid is None else grid
+    results = {}
+    for name in names:
+        for case in grid:
+            timer = timeit.Timer(BENCHMARKS[name](case))
+            number, _ = timer.autorange()
+            seconds = min(timer.repeat(repeat, number)) / number
+            results[key(name, case)] = {'benchmark': name, 'case': case,
+                                        'seconds': seconds}
+    report = {'environment': {
+        'python': platform.python_version(), 'numpy': np.__version__,
+        'platform': platform.platform(), 'time': time.time()},
+        'results': results}
+    if imports:
+        report['import_time'] = import_time()
+    return report
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Compares two benchmark reports.
+
+    :param threshold: relative slow down above which a benchmark is a
+    regression (and speed up above which it is an improvement)
+    :returns: list of (key, baseline seconds, current seconds, ratio,
+    status) for the benchmarks in both reports, where status is
+    'regression', 'improvement' or 'ok'
+    """
+    rows = []
+    entries = [(k, baseline['results'][k]['seconds'],
+                current['results'][k]['seconds'])
+               for k in baseline['results'] if k in current['results']]
+    if 'import_time' in baseline and 'import_time' in current:
+        entries.append(('import_time', baseline['import_time']['seconds'],
+                        current['import_time']['seconds']))
+    for k, before, after in entries:
+        ratio = after / before
+        if ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append((k, before, after, ratio, status))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m pkmodel.benchmarks',
+        description='Benchmarks of the pkmodel solve pipeline.')
+    commands = parser.add_subparsers(dest='command')
+    # set after creation, as Python 3.6 has no required argument
+    commands.required = True
+    runner = commands.add_parser('run', help='run the benchmarks')
+    runner.add_argument('-o', '--output', help='JSON file of the results, '
+                        'default standard output')
+    runner.add_argument('-b', '--benchmark', action='append',
+                        choices=list(BENCHMARKS),
+                        help='benchmark to run (repeatable), default all')
+    runner.add_argument('--full', action='store_true',
+                        help='run every combination of the parameters')
+    runner.add_argument('--repeat', type=int, default=3)
+    comparer = commands.add_parser(
+        'compare', help='compare results with a baseline')
+    comparer.add_argument('baseline')
+    comparer.add_argument('current')
+    comparer.add_argument('--threshold', type=float, default=0.1,
+                          help='relative slow down flagged as a regression')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run(args.benchmark, cases(args.full), args.repeat)
+        text = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(text + '\n')
+        else:
+            print(text)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    width = max([len(row[0]) for row in rows], default=0)
+    for k, before, after, ratio, status in rows:
+        print('%-*s %12.3e %12.3e %7.2fx  %s'
+              % (width, k, before, after, ratio, status))
+    regressions = sum(row[4] == 'regression' for row in rows)
+    print('%d benchmarks, %d regressions' % (len(rows), regressions))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#
+# Solution cache
+#
+import collections
+import threading
+
+import numpy as np
+
+
+class SolutionCache:
+    """A least recently used (LRU) cache of solved models
+
+    Maps hashable keys, built from Model.snapshot(), Protocol.snapshot()
+    and the solver settings, to solver results. Once the estimated size of
+    the cached results exceeds the memory budget, the least recently used
+    entries are evicted.
+
+    Cached arrays are shared between all Solutions with the same key, and
+    should be treated as read-only.
+
+    Parameters
+    ----------
+
+    max_bytes: int, optional
+        memory budget of the cache, default 256 MB. Set to 0 to disable
+        caching.
+
+    """
+    def __init__(self, max_bytes=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Returns the value stored for key, or None, and counts a hit or miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entries
+        to stay within the memory budget. Values larger than the whole
+        budget are not stored.
+        """
+        size = nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def resize(self, max_bytes):
+        """
+        Changes the memory budget, evicting entries if needed.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Removes all entries and resets the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of hits, misses, evictions and
+        entries, the bytes in use and the memory budget.
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'entries': len(self._entries),
+                'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+
+def nbytes(value, _seen=None):
+    """
+    Estimates the memory held by the numpy arrays in value, following
+    tuples, lists, dictionaries, partial functions and object attributes.
+    """
+    seen = set() if _seen is None else _seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(nbytes(v, seen) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(nbytes(v, seen) for v in value)
+    if hasattr(value, 'func') and hasattr(value, 'args'):
+        return nbytes(value.args, seen)
+    if hasattr(value, '__dict__'):
+        return nbytes(vars(value), seen)
+    return 0
+
+
+# The process-wide cache used by Solutions with cache=True
+solution_cache = SolutionCache()
@@ -0,0 +1,220 @@
+#
+# Command line interface
+#
+# pkmodel scenarios.json --output results --processes 4
+#
+# Solves every scenario of a JSON or CSV file and writes, to the output
+# directory, one trajectory file per scenario and a metrics.csv table with a
+# row per scenario and compartment. Results are written as soon as each
+# scenario is solved.
+#
+# A JSON file holds a list of scenarios (or {"scenarios": [...]}), each an
+# object with the fields below. A CSV file has a header of field names and a
+# row per scenario; list fields hold numbers separated by ';' or spaces, and
+# regimens are separated by ';' with their four numbers separated by spaces.
+#
+import argparse
+import collections
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+from . import metrics
+from .model import Model
+from .protocol import Protocol
+from .solution import Solution
+
+# Scenario fields and their types. Missing fields take the defaults of Model,
+# Protocol and Solution.
+FIELDS = {
+    'name': str, 'Vc': float, 'CL': float, 'Vps': 'floats', 'Qps': 'floats',
+    'subcutaneous': bool, 'k_a': float, 'dose_amount': float,
+    'continuous': bool, 'continuous_period': 'floats',
+    'instantaneous': bool, 'dose_times': 'floats',
+    'instant_doses': 'floats', 'regimens': 'regimens', 'tmax': float,
+    'nsteps': int, 'engine': str, 'method': str, 'rtol': float,
+    'atol': float,
+}
+PROTOCOL_FIELDS = ('subcutaneous', 'k_a', 'dose_amount', 'continuous',
+                   'continuous_period', 'instantaneous', 'dose_times',
+                   'instant_doses', 'regimens')
+
+METRICS = ('auc', 'auc_inf', 'cmax', 'tmax', 'cmin', 'half_life')
+
+
+def _parse(field, value):
+    """
+    Converts a JSON or CSV value to the type of a scenario field.
+    """
+    kind = FIELDS[field]
+    if kind == 'floats':
+        if isinstance(value, str):
+            value = value.replace(';', ' ').split()
+        return [float(v) for v in value]
+    if kind == 'regimens':
+        if isinstance(value, str):
+            value = [block.split() for block in value.split(';')
+                     if block.strip()]
+        return [(float(start), float(interval), int(count), float(amount))
+                for start, interval, count, amount in value]
+    if kind is bool and isinstance(value, str):
+        if value.strip().lower() not in ('true', 'false', 'yes', 'no',
+                                         '1', '0'):
+            raise ValueError('%s should be true or false' % field)
+        return value.strip().lower() in ('true', 'yes', '1')
+    if kind is int:
+        return int(float(value))
+    return kind(value)
+
+
+def load_scenarios(path):
+    """
+    Reads the scenarios of a JSON or CSV file.
+
+    :returns: list of dictionaries of typed scenario fields, each with a
+    name (by default 'scenario-1', 'scenario-2', ...). Names are unique
+    and are used as file names in the output directory, so they cannot
+    hold path separators.
+    """
+    with open(path, newline='') as f:
+        if path.lower().endswith('.csv'):
+            rows = [{k: v for k, v in row.items() if v not in ('', None)}
+                    for row in csv.DictReader(f)]
+        else:
+            rows = json.load(f)
+            if isinstance(rows, dict):
+                rows = rows['scenarios']
+    scenarios = []
+    for i, row in enumerate(rows):
+        unknown = set(row) - set(FIELDS)
+        if unknown:
+            raise ValueError('Unknown scenario fields: '
+                             + ', '.join(sorted(unknown)))
+        if 'Vc' not in row or 'CL' not in row:
+            raise ValueError('Every scenario needs Vc and CL')
+        scenario = {'name': 'scenario-' + str(i + 1)}
+        scenario.update({k: _parse(k, v) for k, v in row.items()})
+        name = scenario['name']
+        # both separators, so that files are portable between systems
+        if name in ('', '.', '..') or '/' in name or '\\' in name:
+            raise ValueError('Invalid scenario name: %r' % name)
+        scenarios.append(scenario)
+    counts = collections.Counter(scenario['name'] for scenario in scenarios)
+    duplicates = sorted(name for name, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError('Duplicate scenario names: ' + ', '.join(duplicates))
+    return scenarios
+
+
+def build(scenario):
+    """
+    Returns the Solution of a scenario.
+    """
+    model = Model(Vc=scenario['Vc'], CL=scenario['CL'],
+                  Vps=scenario.get('Vps', []), Qps=scenario.get('Qps', []))
+    protocol = Protocol(**{k: scenario[k] for k in PROTOCOL_FIELDS
+                           if k in scenario})
+    return Solution(model, protocol, tmax=scenario.get('tmax', 1),
+                    nsteps=scenario.get('nsteps', 1000),
+                    engine=scenario.get('engine', 'ode'),
+                    method=scenario.get('method', 'RK45'),
+                    rtol=scenario.get('rtol', 1e-3),
+                    atol=scenario.get('atol', 1e-6), cache=False)
+
+
+def solve(scenario, output, fmt, dtype, threshold):
+    """
+    Solves a scenario, writes its trajectory and returns its metrics rows.
+    Errors are reported in the status column rather than raised, so that
+    one failing scenario does not stop the others.
+    """
+    name = scenario['name']
+    try:
+        solution = build(scenario)
+        result = solution.result(dtype=dtype)
+        if fmt == 'csv':
+            labels = ['q_c'] + ['q_p' + str(i + 1)
+                                for i in range(solution.model.size - 1)]
+            if solution.protocol.subcutaneous:
+                labels.append('q_0')
+            np.savetxt(os.path.join(output, name + '.csv'),
+                       np.vstack((result.t, result.y)).T, delimiter=',',
+                       header=','.join(['t'] + labels), comments='')
+        elif fmt == 'npz':
+            result.save(os.path.join(output, name + '.npz'))
+        c = metrics.concentration(solution.model, solution.sol.y)
+        values = metrics.summary(solution.sol.t, c, threshold=threshold)
+    except Exception as error:
+        return [[name, '', 'error: ' + str(error)]]
+    names = METRICS + (('time_above',) if threshold is not None else ())
+    return [[name, compartment, 'ok']
+            + ['%.10g' % values[metric][compartment] for metric in names]
+            for compartment in range(len(c))]
+
+
+def _solve_task(args):
+    return solve(*args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='pkmodel',
+        description='Solves the PK scenarios of a JSON or CSV file, and '
+                    'writes their trajectories and metrics.')
+    parser.add_argument('scenarios', help='JSON or CSV scenario file')
+    parser.add_argument('-o', '--output', default='pkmodel_results',
+                        help='output directory, default pkmodel_results')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='number of worker processes, default 1')
+    parser.add_argument('-f', '--format', choices=['csv', 'npz', 'none'],
+                        default='csv',
+                        help='format of the trajectory files, default csv')
+    parser.add_argument('--float32', action='store_true',
+                        help='write trajectories in single precision')
+    parser.add_argument('--threshold', type=float,
+                        help='concentration for the time_above metric')
+    args = parser.parse_args(argv)
+
+    try:
+        scenarios = load_scenarios(args.scenarios)
+    except (OSError, ValueError, KeyError, TypeError) as error:
+        parser.error(str(error))
+    os.makedirs(args.output, exist_ok=True)
+    dtype = np.float32 if args.float32 else None
+    tasks = [(scenario, args.output, args.format, dtype, args.threshold)
+             for scenario in scenarios]
+    header = ['scenario', 'compartment', 'status'] + list(METRICS)
+    if args.threshold is not None:
+        header.append('time_above')
+
+    failed = 0
+    with open(os.path.join(args.output, 'metrics.csv'), 'w',
+              newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        if args.processes > 1:
+            import multiprocessing
+            pool = multiprocessing.Pool(args.processes)
+            rows = pool.imap(_solve_task, tasks)
+        else:
+            pool = None
+            rows = map(_solve_task, tasks)
+        try:
+            for scenario_rows in rows:
+                writer.writerows(scenario_rows)
+                f.flush()
+                failed += scenario_rows[0][2] != 'ok'
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+    print('%d scenarios solved, %d failed, results in %s'
+          % (len(scenarios) - failed, failed, args.output))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
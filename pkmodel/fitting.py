@@ -0,0 +1,300 @@
+#
+# Fit class
+#
+import copy
+
+import numpy as np
+
+from .model import Model, matrix_derivatives
+from .solution import Solution
+
+
+class Fit:
+    """Estimation of Pharmokinetic (PK) model parameters from observations
+
+    Fits the parameters of a Model (and the absorption rate k_a of a
+    subcutaneous Protocol) to measured concentrations, by least squares or
+    by maximum likelihood. The parameters are estimated on a log scale, which
+    keeps them positive, and the gradients are analytic: the model is solved
+    once per evaluation together with its forward sensitivities (see
+    Solution), giving the concentrations at all observation times and their
+    derivatives to every parameter.
+
+    Parameters
+    ----------
+
+    model: Model
+        the PK model, whose parameters are the initial guess
+    protocol: Protocol
+        the dosing protocol of the observations. It is copied, and its k_a
+        is the initial guess of the absorption rate.
+    times: list of floats
+        observation times, which should be non-negative
+    concentrations: list of floats
+        observed concentrations, one per observation time
+    compartment: int or list of ints
+        compartment of each observation, 0 for the central compartment and
+        i for peripheral compartment i
+        default value is 0
+    weights: list of floats, optional
+        weight of each observation, e.g. one over its standard deviation.
+        Residuals are multiplied by the weights, and the variance of the
+        error model is divided by their square.
+    parameters: list of str, optional
+        the parameters to estimate, among 'Vc', 'CL', 'Vp1', 'Qp1', ...
+        and 'k_a' for subcutaneous dosing. The others are kept at their
+        initial value.
+        default value is all parameters
+    loss: str
+        'least_squares' or 'likelihood'
+        default value is 'least_squares'
+    error_model: str
+        error model of the likelihood: 'additive' (constant standard
+        deviation sigma_add), 'proportional' (standard deviation sigma_prop
+        times the concentration) or 'combined' (variance sigma_add^2 +
+        (sigma_prop concentration)^2). The error parameters are estimated
+        with the model parameters.
+        default value is 'additive'
+    method: str
+        integration method of the Solution. LSODA switches to a stiff
+        method when needed and stays fast at tight tolerances.
+        default value is 'LSODA'
+    rtol, atol: float
+        tolerances of the Solution. The estimates are only as accurate as
+        the solves, so these are much tighter than those of Solution.
+        default values are 1e-8 and 1e-10
+
+    """
+    losses = ('least_squares', 'likelihood')
+    error_models = ('additive', 'proportional', 'combined')
+
+    def __init__(self, model, protocol, times, concentrations, compartment=0,
+                 weights=None, parameters=None, loss='least_squares',
+                 error_model='additive', method='LSODA', rtol=1e-8,
+                 atol=1e-10):
+        if loss not in self.losses:
+            raise ValueError('loss should be one of ' + str(self.losses))
+        if error_model not in self.error_models:
+            raise ValueError('error_model should be one of '
+                             + str(self.error_models))
+        self.times = np.asarray(times, dtype=float).ravel()
+        self.observations = np.asarray(concentrations, dtype=float).ravel()
+        m = len(self.times)
+        if len(self.observations) != m:
+            raise ValueError('There should be one concentration per time')
+        if m == 0 or np.any(self.times < 0):
+            raise ValueError('Observation times should be non-negative')
+        self.compartment = np.broadcast_to(
+            np.asarray(compartment, dtype=int), (m,))
+        if np.any(self.compartment < 0) or np.any(
+                self.compartment >= model.size):
+            raise ValueError('Observations should be in the central or '
+                             'peripheral compartments')
+        self.weights = np.broadcast_to(
+            np.ones(1) if weights is None
+            else np.asarray(weights, dtype=float), (m,))
+        self.tmax = max(self.times.max(), 1e-9)
+
+        self.protocol = copy.deepcopy(protocol)
+        self.k_a = self.protocol.k_a if self.protocol.subcutaneous else None
+        self.names, _ = matrix_derivatives(model, self.k_a)
+        self.parameters = list(self.names if parameters is None
+                               else parameters)
+        unknown = set(self.parameters) - set(self.names)
+        if unknown or not self.parameters:
+            raise ValueError('parameters should be among ' + str(self.names))
+        self._fitted = np.array([self.names.index(name)
+                                 for name in self.parameters])
+        self.initial = self._flatten(model, self.k_a)
+        self.loss = loss
+        self.error_model = error_model
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+        self.nfev = 0
+        self._last = None
+
+        # parameter whose derivative of the observed volume is one
+        self._volume_parameter = np.where(self.compartment == 0, 0,
+                                          2 * self.compartment)
+
+    @staticmethod
+    def _flatten(model, k_a):
+        """
+        Returns the parameters of a model in the order of matrix_derivatives.
+        """
+        values = [model.Vc, model.CL]
+        for Vp, Qp in zip(model.Vps, model.Qps):
+            values += [Vp, Qp]
+        if k_a is not None:
+            values.append(k_a)
+        return np.array(values, dtype=float)
+
+    def values(self, x):
+        """
+        Returns all parameter values for the log of the fitted ones.
+        """
+        values = self.initial.copy()
+        values[self._fitted] = np.exp(x[:len(self._fitted)])
+        return values
+
+    def build(self, values):
+        """
+        Returns the Model and absorption rate for the parameter values.
+        """
+        n = (len(values) - 2) // 2
+        model = Model(Vc=values[0], CL=values[1],
+                      Vps=values[2:2 + 2 * n:2], Qps=values[3:3 + 2 * n:2])
+        return model, (values[-1] if self.k_a is not None else None)
+
+    def predict(self, x):
+        """
+        Concentrations at the observation times and their derivatives to
+        the log of the fitted parameters, of shapes (observations,) and
+        (fitted parameters, observations).
+        """
+        key = np.asarray(x, dtype=float).tobytes()
+        if self._last is not None and self._last[0] == key:
+            return self._last[1]
+        values = self.values(x)
+        model, k_a = self.build(values)
+        if k_a is not None:
+            self.protocol.k_a = k_a
+        solution = Solution(model, self.protocol, tmax=self.tmax, nsteps=2,
+                            method=self.method, cache=False,
+                            sensitivities=True, rtol=self.rtol,
+                            atol=self.atol)
+        self.nfev += 1
+
+        columns = np.arange(len(self.times))
+        volumes = np.concatenate(([values[0]], values[2:2 * model.size:2]))
+        volume = volumes[self.compartment]
+        q = solution.at(self.times)[self.compartment, columns]
+        dq = solution.sensitivity_at(self.times)[:, self.compartment,
+                                                 columns]
+        concentration = q / volume
+        derivative = dq / volume
+        derivative[self._volume_parameter, columns] -= concentration / volume
+        derivative = (derivative * values[:, None])[self._fitted]
+        self._last = (key, (concentration, derivative))
+        return concentration, derivative
+
+    def residuals(self, x):
+        """
+        Weighted residuals of the model at the log parameters x.
+        """
+        concentration, _ = self.predict(x)
+        return self.weights * (concentration - self.observations)
+
+    def jacobian(self, x):
+        """
+        Derivative of the residuals to the log parameters x.
+        """
+        _, derivative = self.predict(x)
+        return (self.weights * derivative).T
+
+    @property
+    def error_parameters(self):
+        """
+        Names of the error model parameters of the likelihood.
+        """
+        if self.loss != 'likelihood':
+            return []
+        return {'additive': ['sigma_add'], 'proportional': ['sigma_prop'],
+                'combined': ['sigma_add', 'sigma_prop']}[self.error_model]
+
+    def _variance(self, x, concentration):
+        """
+        Variance of each observation and its derivatives to the predicted
+        concentration and to the log error parameters.
+        """
+        sigma = dict(zip(self.error_parameters,
+                         np.exp(x[len(self._fitted):])))
+        w2 = self.weights**2
+        add = sigma.get('sigma_add', 0.)**2 / w2
+        prop = sigma.get('sigma_prop', 0.)**2 * concentration**2 / w2
+        dv_dc = 2 * sigma.get('sigma_prop', 0.)**2 * concentration / w2
+        dv_dsigma = np.array([2 * add if name == 'sigma_add' else 2 * prop
+                              for name in self.error_parameters])
+        return add + prop, dv_dc, dv_dsigma
+
+    def negative_log_likelihood(self, x):
+        """
+        Negative log likelihood of the observations at the log parameters x
+        (model parameters then error parameters) and its gradient.
+        """
+        concentration, derivative = self.predict(x[:len(self._fitted)])
+        v, dv_dc, dv_dsigma = self._variance(x, concentration)
+        e = self.observations - concentration
+        value = 0.5 * np.sum(np.log(2 * np.pi * v) + e**2 / v)
+        dl_dv = 0.5 / v - 0.5 * e**2 / v**2
+        dl_dc = -e / v + dl_dv * dv_dc
+        gradient = np.concatenate((derivative @ dl_dc, dv_dsigma @ dl_dv))
+        return value, gradient
+
+    def fisher_information(self, x):
+        """
+        Expected Fisher information of the log parameters x of the
+        likelihood, whose inverse is the covariance of the estimates.
+        """
+        concentration, derivative = self.predict(x[:len(self._fitted)])
+        v, dv_dc, dv_dsigma = self._variance(x, concentration)
+        dmu = np.concatenate((derivative, np.zeros_like(dv_dsigma)))
+        dv = np.concatenate((derivative * dv_dc, dv_dsigma))
+        return (dmu / v) @ dmu.T + (dv / (2 * v**2)) @ dv.T
+
+    def run(self):
+        """
+        Estimates the parameters.
+
+        :returns: scipy OptimizeResult with the estimates (a dictionary of
+        all parameter values, fitted or not), the fitted parameter_names
+        and their values x, standard_errors, relative_standard_errors,
+        covariance and 95% confidence_intervals (of the log normal
+        approximation), the fitted model and k_a, and the cost (half the sum
+        of squared residuals) or log_likelihood
+        """
+        import scipy.optimize
+        x0 = np.log(self.initial[self._fitted])
+        self.nfev = 0
+        p = len(self._fitted)
+        if self.loss == 'least_squares':
+            result = scipy.optimize.least_squares(
+                self.residuals, x0, jac=self.jacobian, method='trf',
+                x_scale='jac')
+            x = result.x
+            J = self.jacobian(x)
+            dof = max(len(self.times) - p, 1)
+            scale = 2 * result.cost / dof
+            covariance = scale * np.linalg.pinv(J.T @ J)
+            info = {'cost': result.cost}
+        else:
+            residuals = self.residuals(x0)
+            rms = max(np.sqrt(np.mean(residuals**2)), 1e-8)
+            start = {'sigma_add': rms, 'sigma_prop': 0.1}
+            x0 = np.concatenate((x0, np.log([
+                start[name] for name in self.error_parameters])))
+            result = scipy.optimize.minimize(
+                self.negative_log_likelihood, x0, jac=True,
+                method='L-BFGS-B')
+            x = result.x
+            covariance = np.linalg.pinv(self.fisher_information(x))
+            info = {'log_likelihood': -result.fun}
+
+        names = self.parameters + self.error_parameters
+        estimates = np.exp(x)
+        log_errors = np.sqrt(np.clip(np.diag(covariance), 0, None))
+        values = self.values(x)
+        model, k_a = self.build(values)
+        return scipy.optimize.OptimizeResult(
+            x=estimates, parameter_names=names,
+            estimates=dict(zip(self.names + self.error_parameters,
+                               np.concatenate((values, estimates[p:])))),
+            standard_errors=estimates * log_errors,
+            relative_standard_errors=log_errors,
+            covariance=covariance * np.outer(estimates, estimates),
+            confidence_intervals=np.exp(
+                x[:, None] + 1.96 * log_errors[:, None] * [-1, 1]),
+            model=model, k_a=k_a, residuals=self.residuals(x[:p]),
+            nfev=self.nfev, success=result.success,
+            message=result.message, **info)
@@ -0,0 +1,167 @@
+#
+# Pharmacokinetic metrics
+#
+# All metrics take the time points t, of shape (T,), and concentrations c of
+# shape (..., T), e.g. (compartments, T) for a Solution or
+# (N, compartments, T) for a PopulationSolution, and reduce the last axis in
+# one vectorised step.
+#
+import numpy as np
+
+
+def concentration(model, y):
+    """
+    Concentrations in the central and peripheral compartments from drug
+    quantities (the subcutaneous depot has no volume and is left out).
+
+    Parameters
+    ----------
+    model: Model or Population
+        gives the compartment volumes, with leading population dimensions
+        for a Population
+    y: numpy array, shape (..., compartments, T)
+        drug quantities, e.g. Solution.sol.y or PopulationSolution.y
+
+    Returns
+    -------
+    numpy array, shape (..., model.size, T)
+    """
+    Vc = np.asarray(model.Vc, dtype=float)
+    volumes = np.concatenate(
+        (Vc[..., None], np.asarray(model.Vps, dtype=float)
+         .reshape(Vc.shape + (-1,))), axis=-1)
+    y = np.asarray(y, dtype=float)
+    return y[..., :volumes.shape[-1], :] / volumes[..., None]
+
+
+def auc(t, c, method='linear'):
+    """
+    Area under the concentration curve over t, by the trapezoid rule.
+
+    Parameters
+    ----------
+    method: str
+        'linear' for the linear trapezoid rule, or 'log' for the linear-up
+        log-down rule, which integrates decreasing positive intervals as
+        exponential decays
+        default value is 'linear'
+    """
+    if method not in ('linear', 'log'):
+        raise ValueError("method should be 'linear' or 'log'")
+    t = np.asarray(t, dtype=float)
+    c = np.asarray(c, dtype=float)
+    dt = np.diff(t)
+    c0, c1 = c[..., :-1], c[..., 1:]
+    area = 0.5 * (c0 + c1) * dt
+    if method == 'log':
+        decay = (c1 < c0) & (c1 > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            log_area = (c0 - c1) / np.log(c0 / c1) * dt
+        area = np.where(decay, log_area, area)
+    return area.sum(axis=-1)
+
+
+def cmax(t, c):
+    """
+    Maximum concentration.
+    """
+    return np.max(c, axis=-1)
+
+
+def tmax(t, c):
+    """
+    Time of the maximum concentration (the first one, if it is reached
+    several times).
+    """
+    return np.asarray(t)[np.argmax(c, axis=-1)]
+
+
+def cmin(t, c):
+    """
+    Minimum concentration.
+    """
+    return np.min(c, axis=-1)
+
+
+def trough(t, c, dose_times):
+    """
+    Trough concentrations: the concentration at the last time point before
+    each dose time, of shape (..., len(dose_times)). Doses before the first
+    time point give NaN.
+    """
+    t = np.asarray(t, dtype=float)
+    c = np.asarray(c, dtype=float)
+    k = np.searchsorted(t, np.asarray(dose_times, dtype=float),
+                        side='left') - 1
+    troughs = c[..., np.maximum(k, 0)]
+    return np.where(k >= 0, troughs, np.nan)
+
+
+def terminal_slope(t, c, points=3):
+    """
+    Terminal elimination rate constant lambda_z, from the log-linear least
+    squares fit of the last points concentrations. Curves that are not
+    positive at these points, or not decreasing, give NaN.
+    """
+    t = np.asarray(t, dtype=float)[-points:]
+    c = np.asarray(c, dtype=float)[..., -points:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_c = np.log(c)
+    dt = t - t.mean()
+    slope = (log_c - log_c.mean(axis=-1, keepdims=True)) @ dt / (dt @ dt)
+    valid = np.all(c > 0, axis=-1) & (slope < 0)
+    return np.where(valid, -slope, np.nan)
+
+
+def half_life(t, c, points=3):
+    """
+    Terminal half-life, log(2) / lambda_z (see terminal_slope).
+    """
+    return np.log(2) / terminal_slope(t, c, points)
+
+
+def auc_inf(t, c, method='linear', points=3):
+    """
+    Area under the concentration curve extrapolated to infinity: the AUC
+    over t plus the last concentration divided by lambda_z (see auc and
+    terminal_slope).
+    """
+    c = np.asarray(c, dtype=float)
+    return auc(t, c, method) + c[..., -1] / terminal_slope(t, c, points)
+
+
+def time_above(t, c, threshold):
+    """
+    Time spent above a concentration threshold, interpolating linearly
+    between time points. The threshold broadcasts against c[..., 0].
+    """
+    t = np.asarray(t, dtype=float)
+    c = np.asarray(c, dtype=float)
+    threshold = np.asarray(threshold, dtype=float)[..., None]
+    c0, c1 = c[..., :-1], c[..., 1:]
+    high, low = np.maximum(c0, c1), np.minimum(c0, c1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.clip((high - threshold) / (high - low), 0, 1)
+    fraction = np.where(high == low, high > threshold, fraction)
+    return (fraction * np.diff(t)).sum(axis=-1)
+
+
+def summary(t, c, threshold=None, dose_times=None, method='linear',
+            points=3):
+    """
+    Computes all metrics at once.
+
+    :returns: dictionary of arrays of shape c.shape[:-1], with keys 'auc',
+    'auc_inf', 'cmax', 'tmax', 'cmin', 'half_life', and 'time_above' if a
+    threshold is given and 'trough' (of shape (..., len(dose_times))) if
+    dose times are given
+    """
+    metrics = {'auc': auc(t, c, method),
+               'auc_inf': auc_inf(t, c, method, points),
+               'cmax': cmax(t, c), 'tmax': tmax(t, c), 'cmin': cmin(t, c),
+               'half_life': half_life(t, c, points)}
+    if threshold is not None:
+        metrics['time_above'] = time_above(t, c, threshold)
+    if dose_times is not None:
+        metrics['trough'] = trough(t, c, dose_times)
+    return metrics
@@ -1,6 +1,8 @@
 #
 # Model class
 #
+import numpy as np
+
 
 class Model:
     """A Pharmokinetic (PK) model
@@ -19,27 +21,40 @@ class Model:
         and peripheral compartments
 
     """
+    __slots__ = ('__central_volume', '__CL', '__Vps', '__Qps', '__frozen',
+                 '__compiled', '__snapshot')
+
     def __init__(self, Vc, Vps, Qps, CL):
-        self.__compartments = []
         self.__central_volume = Vc
-        self.__n_compartments = 1  # nb Includes central compartment
         self.__CL = CL
-        for Vp, Qp in zip(Vps, Qps):
-            self.add_compartment(Vp, Qp)
+        self.__Vps = np.array(Vps, dtype=float).ravel()
+        self.__Qps = np.array(Qps, dtype=float).ravel()
+        if len(self.__Vps) != len(self.__Qps):
+            # keep the pairs that were given, as zip() would
+            n = min(len(self.__Vps), len(self.__Qps))
+            self.__Vps = self.__Vps[:n]
+            self.__Qps = self.__Qps[:n]
+        self.__frozen = False
+        self.__compiled = None
+        self.__snapshot = None
 
     def add_compartment(self, Vp=1, Qp=1):
         """
         Add a peripheral compartment to the model.
         """
-        self.__n_compartments += 1
-        self.__compartments.append({'Vp': Vp, 'Qp': Qp})
+        if self.__frozen:
+            raise AttributeError('Cannot add a compartment to a frozen model')
+        self.__Vps = np.append(self.__Vps, float(Vp))
+        self.__Qps = np.append(self.__Qps, float(Qp))
+        self.__compiled = None
+        self.__snapshot = None
 
     @property
     def Vps(self):
         """
         Volumes of the peripheral compartments.
         """
-        return [elem['Vp'] for elem in self.__compartments]
+        return self.__Vps.tolist()
 
     @property
     def Qps(self):
@@ -47,7 +62,7 @@ class Model:
         Transition rates between central compartment
         and peripheral compartments.
         """
-        return [elem['Qp'] for elem in self.__compartments]
+        return self.__Qps.tolist()
 
     @property
     def Vc(self):
@@ -61,7 +76,7 @@ class Model:
         """
         Returns the number of peripheral compartments.
         """
-        return self.__n_compartments
+        return len(self.__Vps) + 1
 
     @property
     def CL(self):
@@ -69,3 +84,229 @@ class Model:
         Returns the clearance/elimination rate from the central compartment.
         """
         return self.__CL
+
+    @property
+    def frozen(self):
+        """
+        True once freeze() has been called.
+        """
+        return self.__frozen
+
+    def snapshot(self):
+        """
+        Returns a canonical, hashable snapshot of the model parameters:
+        (Vc, CL, Vps, Qps) as floats and tuples of floats. Models with equal
+        parameters have equal snapshots. It is computed once and reused
+        until a compartment is added.
+        """
+        if self.__snapshot is None:
+            self.__snapshot = (float(self.Vc), float(self.CL),
+                               tuple(self.__Vps.tolist()),
+                               tuple(self.__Qps.tolist()))
+        return self.__snapshot
+
+    def compile(self):
+        """
+        Returns the CompiledModel of the current parameters. It is computed
+        once and reused until a compartment is added.
+        """
+        if self.__compiled is None:
+            self.__compiled = CompiledModel(self.Vc, self.__Vps, self.__Qps,
+                                            self.CL)
+        return self.__compiled
+
+    def freeze(self):
+        """
+        Makes the model immutable (add_compartment() raises an error) and
+        returns its CompiledModel.
+        """
+        self.__frozen = True
+        return self.compile()
+
+
+class CompiledModel:
+    """An immutable, precomputed Pharmokinetic (PK) model
+
+    Holds the parameters of a Model as read-only numpy arrays together
+    with the derived quantities that the solvers use, so that these are
+    not recomputed for every solve. Made by Model.compile() or
+    Model.freeze(), and can be passed to a Solution in place of the Model.
+
+    Attributes
+    ----------
+
+    Vc, CL: float
+        central compartment volume and clearance
+    Vps, Qps: numpy arrays
+        volumes of, and transition rates to, the peripheral compartments
+    volumes: numpy array
+        volumes of all compartments, central first
+    Q_over_Vp, Q_over_Vc: numpy arrays
+        transition rates divided by the peripheral and central volumes
+    Q_total: float
+        sum of all transition rates
+    matrix: numpy array
+        the intravenous transfer matrix A of compartment_matrix()
+
+    """
+    __slots__ = ('Vc', 'CL', 'Vps', 'Qps', 'volumes', 'Q_over_Vp',
+                 'Q_over_Vc', 'Q_total', 'matrix', '_key')
+
+    def __init__(self, Vc, Vps, Qps, CL):
+        Vps = np.array(Vps, dtype=float)
+        Qps = np.array(Qps, dtype=float)
+        values = {
+            'Vc': float(Vc), 'CL': float(CL), 'Vps': Vps, 'Qps': Qps,
+            'volumes': np.concatenate(([float(Vc)], Vps)),
+            'Q_over_Vp': Qps / Vps, 'Q_over_Vc': Qps / float(Vc),
+            'Q_total': float(Qps.sum()),
+        }
+        values['_key'] = (values['Vc'], values['CL'], tuple(Vps.tolist()),
+                          tuple(Qps.tolist()))
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+        object.__setattr__(self, 'matrix', compartment_matrix(self)[0])
+        for name in ('Vps', 'Qps', 'volumes', 'Q_over_Vp', 'Q_over_Vc',
+                     'matrix'):
+            getattr(self, name).flags.writeable = False
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CompiledModel is immutable')
+
+    def __reduce__(self):
+        return CompiledModel, (self.Vc, self.Vps, self.Qps, self.CL)
+
+    @property
+    def size(self):
+        """
+        Returns the number of compartments, including the central one.
+        """
+        return len(self.Vps) + 1
+
+    def snapshot(self):
+        """
+        Returns the same snapshot as the Model it was compiled from.
+        """
+        return self._key
+
+    def compile(self):
+        """
+        Returns itself, so compiled and plain models can be used alike.
+        """
+        return self
+
+    def system(self, k_a=None):
+        """
+        Returns the transfer matrix and input vector (A, b), as
+        compartment_matrix(), from the precomputed intravenous matrix.
+        """
+        n = self.size
+        if k_a is None:
+            b = np.zeros(n)
+            b[0] = 1
+            return self.matrix, b
+        A = np.zeros((n + 1, n + 1))
+        A[:n, :n] = self.matrix
+        A[0, -1] = k_a
+        A[-1, -1] = -k_a
+        b = np.zeros(n + 1)
+        b[-1] = 1
+        return A, b
+
+
+def compartment_matrix(model, k_a=None):
+    """
+    Compiles a model into the linear system dq/dt = A q + b dose(t).
+
+    Parameters
+    ----------
+    model: Model
+        any object exposing Vc, CL, Vps and Qps. These may also be arrays
+        with leading population dimensions (Vc and CL of shape (...),
+        Vps and Qps of shape (..., n_peripheral)), giving a stack of
+        matrices.
+    k_a: float or array, optional
+        absorption rate of a subcutaneous depot compartment. If given, the
+        depot is appended as the last state and receives the dose, otherwise
+        the dose goes straight into the central compartment.
+
+    Returns
+    -------
+    A: (..., n, n) numpy array
+        transfer matrix between compartments, including clearance
+    b: (n,) numpy array
+        input vector that the dose rate is multiplied by
+    """
+    Vc = np.asarray(model.Vc, dtype=float)
+    CL = np.asarray(model.CL, dtype=float)
+    Vps = np.asarray(model.Vps, dtype=float)
+    Qps = np.asarray(model.Qps, dtype=float)
+    n = Vps.shape[-1] + 1
+    size = n if k_a is None else n + 1
+
+    A = np.zeros(Vc.shape + (size, size))
+    b = np.zeros(size)
+    idx = np.arange(1, n)
+    # flux between the central and each peripheral compartment
+    A[..., 0, 0] = -(CL + Qps.sum(axis=-1)) / Vc
+    A[..., 0, idx] = Qps / Vps
+    A[..., idx, 0] = Qps / Vc[..., None]
+    A[..., idx, idx] = -Qps / Vps
+    if k_a is None:
+        b[0] = 1
+    else:
+        A[..., 0, -1] = k_a
+        A[..., -1, -1] = -np.asarray(k_a)
+        b[-1] = 1
+    return A, b
+
+
+def matrix_derivatives(model, k_a=None):
+    """
+    Derivatives of the transfer matrix of compartment_matrix() with respect
+    to each model parameter, used for sensitivity analysis.
+
+    Parameters
+    ----------
+    model: Model
+        any object exposing Vc, CL, Vps and Qps
+    k_a: float, optional
+        absorption rate of a subcutaneous depot compartment, which is then
+        included as the last parameter
+
+    Returns
+    -------
+    names: list of str
+        the parameters: 'Vc', 'CL', then 'Vp1', 'Qp1', 'Vp2', 'Qp2', ... for
+        each peripheral compartment, and 'k_a' for subcutaneous dosing
+    dA: (parameters, n, n) numpy array
+        derivative of A with respect to each parameter
+    """
+    Vc = float(model.Vc)
+    Vps = np.asarray(model.Vps, dtype=float)
+    Qps = np.asarray(model.Qps, dtype=float)
+    n = len(Vps) + 1
+    size = n if k_a is None else n + 1
+    names = ['Vc', 'CL']
+    for i in range(1, n):
+        names += ['Vp' + str(i), 'Qp' + str(i)]
+    if k_a is not None:
+        names.append('k_a')
+
+    dA = np.zeros((len(names), size, size))
+    idx = np.arange(1, n)
+    dA[0, 0, 0] = (model.CL + Qps.sum()) / Vc**2
+    dA[0, idx, 0] = -Qps / Vc**2
+    dA[1, 0, 0] = -1 / Vc
+    for i, (Vp, Qp) in enumerate(zip(Vps, Qps), start=1):
+        dVp, dQp = dA[2 * i], dA[2 * i + 1]
+        dVp[0, i] = -Qp / Vp**2
+        dVp[i, i] = Qp / Vp**2
+        dQp[0, 0] = -1 / Vc
+        dQp[0, i] = 1 / Vp
+        dQp[i, 0] = 1 / Vc
+        dQp[i, i] = -1 / Vp
+    if k_a is not None:
+        dA[-1, 0, -1] = 1
+        dA[-1, -1, -1] = -1
+    return names, dA
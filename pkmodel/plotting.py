@@ -0,0 +1,368 @@
+#
+# Plotting of solutions
+#
+# This module is imported on first use by the plotting methods of Solution,
+# so that importing pkmodel does not import matplotlib. Figures are drawn on
+# the non-interactive Agg canvas, without pyplot and its backend, unless
+# pyplot is already in use (e.g. in an interactive session), in which case
+# they are made with pyplot so that they can be shown.
+#
+import os
+import sys
+
+import matplotlib
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .solution import Solution
+
+
+def _figure(figsize):
+    """
+    Creates a figure, through pyplot only if pyplot has been imported.
+    """
+    if 'matplotlib.pyplot' in sys.modules:
+        return sys.modules['matplotlib.pyplot'].figure(figsize=figsize)
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def _pixels(inches):
+    """
+    Number of pixels across a width in inches, at the larger of the figure
+    and the saved figure resolutions.
+    """
+    dpi = matplotlib.rcParams['figure.dpi']
+    if matplotlib.rcParams['savefig.dpi'] != 'figure':
+        dpi = max(dpi, float(matplotlib.rcParams['savefig.dpi']))
+    return int(inches * dpi)
+
+
+def decimate(t, y, buckets):
+    """
+    Downsamples curves for plotting without visible loss: the time points
+    are split into buckets (one per pixel across the axes), and only the
+    minimum and maximum of each curve in each bucket are kept, together
+    with the first and last points. Peaks and the jumps of instantaneous
+    doses are therefore kept, and the number of points drawn depends on
+    the resolution rather than on the length of the solution.
+
+    :param t: time points, shape (T,)
+    :param y: curves, shape (curves, T)
+    :param buckets: number of buckets
+    :returns: (t, y), both of shape (curves, points), with at most
+    2 * buckets + 2 points per curve (t and y unchanged, with t broadcast,
+    if there are fewer than 4 * buckets points)
+    """
+    t = np.asarray(t)
+    y = np.asarray(y)
+    T = len(t)
+    if T < 4 * buckets:
+        return np.broadcast_to(t, y.shape), y
+    size = -(-T // buckets)
+    padded = np.pad(y, ((0, 0), (0, buckets * size - T)), mode='edge')
+    padded = padded.reshape(len(y), buckets, size)
+    start = np.arange(buckets) * size
+    low = start + np.argmin(padded, axis=-1)
+    high = start + np.argmax(padded, axis=-1)
+    index = np.stack((np.minimum(low, high), np.maximum(low, high)), axis=-1)
+    index = np.minimum(index.reshape(len(y), -1), T - 1)
+    index = np.concatenate((np.zeros((len(y), 1), dtype=int), index,
+                            np.full((len(y), 1), T - 1)), axis=1)
+    return t[index], np.take_along_axis(y, index, axis=1)
+
+
+def plot(solution, separate=False):
+    """
+    Generate a figure of the drug quantity per
+    compartment over time for the corresponding model
+
+    :param separate: set to True if you want 1 plot per compartment
+    :returns: matplotlib figure
+    """
+    sol = solution.sol
+    t, y = decimate(sol.t, sol.y, _pixels(4.0))
+    n = solution.model.size
+    if separate:
+        fig = _figure(figsize=(n * 4.0, 3.0))
+        central = fig.add_subplot(1, n, 1)
+        central.plot(t[0], y[0], label='- q_c')
+        central.legend()
+        central.set_title('Central compartment')
+    else:
+        fig = _figure(figsize=(4.0, 3.0))
+        model = fig.add_subplot(1, 1, 1)
+        model.plot(t[0], y[0], label='- q_c')
+
+    # add legend and axes labels
+    axes = central if separate else model
+    axes.set_ylabel('drug mass [ng]')
+    axes.set_xlabel('time [h]')
+
+    # loop over peripheral compartments and plot drug quantity for each
+    for i in range(n - 1):
+        label = '- q_p' + str(i + 2)
+        if separate:
+            subplot = fig.add_subplot(1, n, i + 2)
+            subplot.plot(t[i + 1], y[i + 1], label=label)
+            subplot.legend()
+            subplot.set_xlabel('time [h]')
+            subplot.set_title('Peripheral compartment #' + str(i + 1))
+        else:
+            model.plot(t[i + 1], y[i + 1], label=label)
+
+    # plot subcutanous injections compartment
+    if solution.protocol.subcutaneous and not separate:
+        model.plot(t[-1], y[-1], label='- q_0')
+
+    fig.axes[-1].legend()
+    fig.tight_layout()
+    return fig
+
+
+def compare_plots(solution, solution_2):
+    """
+    Generates a matplotlib figure with two subplots that show
+    the drug quantity in each compartment over time for the models
+    of solution and solution_2
+
+    :param solution_2: Should be a Solution object different from solution
+
+    :returns: Matplotlib Figure object
+    """
+    t1, y1 = decimate(solution.sol.t, solution.sol.y, _pixels(4.0))
+    t2, y2 = decimate(solution_2.sol.t, solution_2.sol.y, _pixels(4.0))
+    n = max(solution.model.size, solution_2.model.size)
+    fig = _figure(figsize=(2 * 4.0, 3.0))
+    model1 = fig.add_subplot(1, 2, 1)
+    model1.set_title('Model 1')
+    model1.set_xlabel('time [h]')
+    model1.set_ylabel('drug mass [ng]')
+    model2 = fig.add_subplot(1, 2, 2)
+    model2.set_title('Model 2')
+    model2.set_xlabel('time [h]')
+    for i in range(n):
+        if i == 0:
+            label = '- q_c'
+        else:
+            label = '- q_p' + str(i + 1)
+        if i < len(y1):
+            model1.plot(t1[i], y1[i], label=label)
+        if i < len(y2):
+            model2.plot(t2[i], y2[i], label=label)
+    # plot subcutanous injections compartment
+    if solution.protocol.subcutaneous:
+        model1.plot(t1[-1], y1[-1], label='- q_0')
+    if solution_2.protocol.subcutaneous:
+        model2.plot(t2[-1], y2[-1], label='- q_0')
+    model1.legend()
+    model2.legend()
+    fig.tight_layout()
+    return fig
+
+
+def compare_separate(solution, solution_2):
+    """
+    Generates a matplotlib figure that shows the drug quantity over time
+    for the models solution and solution_2, with one plot per compartment
+
+    :param solution_2: Should be a Solution object different from solution
+
+    :returns: Matplotlib Figure object
+    """
+    t1, y1 = decimate(solution.sol.t, solution.sol.y, _pixels(4.0))
+    t2, y2 = decimate(solution_2.sol.t, solution_2.sol.y, _pixels(4.0))
+    n = max(solution.model.size, solution_2.model.size)
+    fig = _figure(figsize=(n * 4.0, 3.0))
+    central = fig.add_subplot(1, n, 1)
+    central.plot(t1[0], y1[0], label='model 1')
+    central.plot(t2[0], y2[0], label='model 2')
+    central.legend()
+    central.set_xlabel('time [h]')
+    central.set_ylabel('drug mass [ng]')
+    central.set_title('Central compartment')
+    for i in range(n - 1):
+        compartment = fig.add_subplot(1, n, i + 2)
+        if i + 1 < len(y1):
+            compartment.plot(t1[i + 1], y1[i + 1], label='model 1')
+        if i + 1 < len(y2):
+            compartment.plot(t2[i + 1], y2[i + 1], label='model 2')
+        compartment.legend()
+        compartment.set_xlabel('time [h]')
+        compartment.set_title('Peripheral compartment #' + str(i + 1))
+    fig.tight_layout()
+    return fig
+
+
+def generate_plot(solution, compare=None,
+                  separate=False, show=False, savefig=False):
+    """
+    Calls appropriate function to generate plots of the drug
+    quantity per compartment over time for the corresponding model
+
+    :param compare: If None (default), function will only generate plot
+    for the Solution object. If set to a Solution object, function will
+    generate plots to compare the two models. Else, function will raise an
+    Assertion Error.
+
+    :param separate: If False (default), will show all compartments on the
+    same plot. Set to True if you want 1 plot per compartment.
+    """
+    if show:
+        # figures made through pyplot can be shown interactively
+        import matplotlib.pyplot as plt
+    fig = None
+    if compare is None:
+        fig = plot(solution, separate=separate)
+    else:
+        assert type(compare) is Solution, 'compare should be a Solution'
+        if not separate:
+            fig = compare_plots(solution, compare)
+        elif separate:
+            fig = compare_separate(solution, compare)
+
+    if show:
+        plt.show()
+
+    if type(savefig) is str:
+        fig.savefig(savefig + '.pdf')
+    elif savefig:
+        fig.savefig('pkplot.pdf')
+
+    return fig
+
+
+def render_batch(results, path, rows=3, cols=3, titles=None, processes=1,
+                 dpi=100):
+    """
+    Renders many solutions headlessly as small multiples, rows x cols
+    panels per page, one panel per solution with a line per compartment.
+
+    The figure and its axes are made once per process and reused for every
+    page, and nothing is registered with pyplot, so no figures are left
+    open.
+
+    :param results: Solution, PopulationSolution or Result (whose y may
+    have a leading scenario dimension), or a list of these
+    :param path: a '.pdf' path gives a single multi-page PDF. A '.png'
+    path gives one PNG per page, numbered as path-001.png, path-002.png...
+    :param rows, cols: number of panels per page
+    :param titles: list of panel titles, default 'Scenario 1', ...
+    :param processes: number of worker processes rendering PNG pages in
+    parallel (a multi-page PDF is written by a single process)
+    :param dpi: resolution of PNG pages
+    :returns: list of the files written
+    """
+    panels = _panels(results)
+    if titles is None:
+        titles = ['Scenario ' + str(i + 1) for i in range(len(panels))]
+    if len(titles) != len(panels):
+        raise ValueError('There should be one title per panel')
+    per_page = rows * cols
+    pages = [list(range(start, min(start + per_page, len(panels))))
+             for start in range(0, len(panels), per_page)]
+
+    path = os.fspath(path)
+    stem, suffix = path[:-4], path[-4:].lower()
+    if suffix == '.pdf':
+        from matplotlib.backends.backend_pdf import PdfPages
+        renderer = _PageRenderer(rows, cols)
+        with PdfPages(path) as pdf:
+            for page in pages:
+                renderer.draw([panels[i] for i in page],
+                              [titles[i] for i in page])
+                pdf.savefig(renderer.fig)
+        renderer.close()
+        return [path]
+    if suffix != '.png':
+        raise ValueError('path should end in .pdf or .png')
+
+    files = [stem + '-%03d.png' % (k + 1) for k in range(len(pages))]
+    tasks = [([panels[i] for i in page], [titles[i] for i in page], file)
+             for page, file in zip(pages, files)]
+    if processes == 1 or len(tasks) < 2:
+        _render_pages(rows, cols, dpi, tasks)
+        return files
+    import multiprocessing
+    processes = min(processes, len(tasks))
+    chunks = [tasks[k::processes] for k in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        pool.starmap(_render_pages,
+                     [(rows, cols, dpi, chunk) for chunk in chunks])
+    return files
+
+
+def _panels(results):
+    """
+    Returns the (t, y) pairs of one scenario each from solutions and
+    results.
+    """
+    if isinstance(results, (list, tuple)):
+        return [panel for result in results for panel in _panels(result)]
+    if hasattr(results, 'sol'):
+        return [(results.sol.t, results.sol.y)]
+    t = results.t_eval if hasattr(results, 't_eval') else results.t
+    if results.y.ndim == 2:
+        return [(t, results.y)]
+    return [(t, y) for y in results.y]
+
+
+def _render_pages(rows, cols, dpi, tasks):
+    """
+    Renders (panels, titles, file) pages to PNG files with one figure.
+    """
+    renderer = _PageRenderer(rows, cols, dpi)
+    for panels, titles, file in tasks:
+        renderer.draw(panels, titles)
+        renderer.fig.savefig(file, dpi=dpi)
+    renderer.close()
+
+
+class _PageRenderer:
+    """
+    A reusable page of rows x cols axes. Lines are created once and their
+    data replaced for every page.
+    """
+    def __init__(self, rows, cols, dpi=None):
+        self.fig = Figure(figsize=(cols * 3.0, rows * 2.2))
+        self.pixels = _pixels(3.0) if dpi is None else int(3.0 * dpi)
+        FigureCanvasAgg(self.fig)
+        self.axes = self.fig.subplots(rows, cols, squeeze=False).ravel()
+        self.lines = [[] for _ in self.axes]
+        for k, axes in enumerate(self.axes):
+            if k >= (rows - 1) * cols:
+                axes.set_xlabel('time [h]')
+            if k % cols == 0:
+                axes.set_ylabel('drug mass [ng]')
+        self.fig.tight_layout()
+
+    def draw(self, panels, titles):
+        for k, axes in enumerate(self.axes):
+            lines = self.lines[k]
+            visible = k < len(panels)
+            axes.set_visible(visible)
+            if not visible:
+                continue
+            t, y = decimate(*panels[k], self.pixels)
+            while len(lines) < len(y):
+                label = '- q_c' if not lines else '- q_p' + str(len(lines) + 1)
+                lines.extend(axes.plot([], [], label=label))
+            for i, line in enumerate(lines):
+                line.set_visible(i < len(y))
+                if i < len(y):
+                    line.set_data(t[i], y[i])
+            axes.set_title(titles[k])
+            axes.relim(visible_only=True)
+            axes.autoscale_view()
+        self.axes[0].legend(handles=[line for line in self.lines[0]
+                                     if line.get_visible()],
+                            fontsize='small')
+
+    def close(self):
+        """
+        Releases the figure and its axes.
+        """
+        self.fig.clear()
+        self.fig = self.axes = self.lines = None
@@ -0,0 +1,269 @@
+#
+# Population class
+#
+import numpy as np
+
+from .model import compartment_matrix
+from .propagator import decompose, integrate_modal, propagate_modal
+from .result import Result
+from .solution import Trajectory
+
+
+class Population:
+    """A virtual population of Pharmokinetic (PK) models
+
+    All subjects share the same number of peripheral compartments, but each
+    has its own parameter values. Parameters are stored as arrays with the
+    subjects along the first axis.
+
+    Parameters
+    ----------
+
+    Vc: array of floats, shape (N,)
+        central compartment volume of each subject
+    CL: array of floats, shape (N,)
+        clearance/elimination rate of each subject
+    Vps: array of floats, shape (N, n_peripheral), optional
+        volumes of the peripheral compartments of each subject
+    Qps: array of floats, shape (N, n_peripheral), optional
+        transition rates between the central and peripheral compartments
+    k_a: array of floats, shape (N,), optional
+        absorption rates for subcutaneous dosing. If None, the k_a of each
+        subject's protocol is used.
+
+    """
+    def __init__(self, Vc, CL, Vps=None, Qps=None, k_a=None):
+        self.Vc = np.atleast_1d(np.asarray(Vc, dtype=float))
+        self.CL = np.broadcast_to(np.asarray(CL, dtype=float),
+                                  self.Vc.shape).copy()
+        if Vps is None:
+            Vps = np.zeros((len(self.Vc), 0))
+        if Qps is None:
+            Qps = np.zeros((len(self.Vc), 0))
+        self.Vps = np.asarray(Vps, dtype=float).reshape(len(self.Vc), -1)
+        self.Qps = np.asarray(Qps, dtype=float).reshape(len(self.Vc), -1)
+        if self.Vps.shape != self.Qps.shape:
+            raise ValueError('Vps and Qps should have the same shape')
+        self.k_a = None if k_a is None else np.broadcast_to(
+            np.asarray(k_a, dtype=float), self.Vc.shape).copy()
+
+    @classmethod
+    def from_models(cls, models, k_a=None):
+        """
+        Builds a population from a list of Model objects, which should all
+        have the same number of peripheral compartments.
+        """
+        return cls(Vc=[model.Vc for model in models],
+                   CL=[model.CL for model in models],
+                   Vps=[model.Vps for model in models],
+                   Qps=[model.Qps for model in models], k_a=k_a)
+
+    def __len__(self):
+        return len(self.Vc)
+
+    @property
+    def size(self):
+        """
+        Returns the number of compartments, including the central one.
+        """
+        return self.Vps.shape[1] + 1
+
+
+class PopulationSolution:
+    """A Pharmokinetic (PK) solution for a whole population
+
+    All subjects are solved together: the state is a stacked array of
+    shape (N, compartments), propagated exactly with a batched
+    eigendecomposition, or integrated as one stacked ODE system.
+
+    Parameters
+    ----------
+
+    population: Population
+        the subjects' model parameters
+
+    protocols: Protocol or list of N Protocols
+        dosing protocol shared by all subjects, or one per subject. The
+        dosing route (subcutaneous or intravenous) should be the same for
+        all of them.
+
+    tmax: float
+        solves until it reaches tmax
+        default value is 1
+
+    nsteps: int
+        number of output time points
+        default value is 1000
+
+    engine: str
+        'exact' (default) or 'ode', as in Solution
+
+    method: str
+        integration method of the 'ode' engine, as in Solution
+        default value is 'RK45'
+
+    rtol, atol: float
+        tolerances of the 'ode' engine, as in Solution
+        default values are 1e-3 and 1e-6
+
+    """
+    engines = ('exact', 'ode')
+
+    def __init__(self, population, protocols, tmax=1, nsteps=1000,
+                 engine='exact', method='RK45', rtol=1e-3, atol=1e-6):
+        if engine not in self.engines:
+            raise ValueError('engine should be one of ' + str(self.engines))
+        if not isinstance(protocols, (list, tuple)):
+            protocols = [protocols] * len(population)
+        if len(protocols) != len(population):
+            raise ValueError('There should be one protocol per subject')
+        subcutaneous = {bool(protocol.subcutaneous) for protocol in protocols}
+        if len(subcutaneous) > 1:
+            raise ValueError('All protocols should use the same dosing route')
+
+        self.population = population
+        self.protocols = protocols
+        self.subcutaneous = subcutaneous.pop()
+        self.t_eval = np.linspace(0, tmax, nsteps)
+        self.tmax = tmax
+        self.nsteps = nsteps
+        self.engine = engine
+        self.method = method
+        self.rtol = rtol
+        self.atol = atol
+
+        self.solver()
+
+    def schedule(self):
+        """
+        Merges the dosing schedules of all subjects onto the union of their
+        event times.
+
+        Returns: tuple (times, boluses, rates) with times of shape (E,), and
+        boluses and rates of shape (N, E).
+        """
+        schedules = {}
+        for protocol in self.protocols:
+            if id(protocol) not in schedules:
+                schedules[id(protocol)] = protocol.schedule(self.tmax)
+        times = np.unique(np.concatenate(
+            [schedule[0] for schedule in schedules.values()]))
+
+        merged = {}
+        for key, (t, boluses, rates) in schedules.items():
+            on_union = np.zeros(len(times))
+            on_union[np.searchsorted(times, t)] = boluses
+            k = np.searchsorted(t, times, side='right') - 1
+            merged[key] = on_union, rates[k]
+        boluses = np.array([merged[id(p)][0] for p in self.protocols])
+        rates = np.array([merged[id(p)][1] for p in self.protocols])
+        return times, boluses, rates
+
+    def solver(self):
+        '''
+        Solves all subjects together with the chosen engine
+
+        :returns: array of amounts of shape (N, compartments, nsteps)
+        '''
+        k_a = None
+        if self.subcutaneous:
+            k_a = self.population.k_a
+            if k_a is None:
+                k_a = np.array([p.k_a for p in self.protocols], dtype=float)
+        self.A, self.b = compartment_matrix(self.population, k_a)
+        schedule = self.schedule()
+        if self.engine == 'exact':
+            self.y = self.exact_solver(schedule, k_a)
+        else:
+            self.y = self.ode_solver(schedule)
+        return self.y
+
+    def result(self, dtype=None):
+        '''
+        The solution as a lean Result
+
+        :param dtype: dtype of the result, e.g. numpy.float32
+        :returns: Result with y of shape (N, compartments, nsteps)
+        '''
+        return Result(self.t_eval, self.y, dtype=dtype)
+
+    def exact_solver(self, schedule, k_a):
+        '''
+        Propagates the stacked modal state of all subjects exactly from
+        event to event, then evaluates all output times at once
+        '''
+        times, boluses, rates = schedule
+        A_iv, _ = compartment_matrix(self.population)
+        volumes = np.concatenate((self.population.Vc[:, None],
+                                  self.population.Vps), axis=1)
+        eigenvalues, W, W_inv = decompose(A_iv, volumes, k_a)
+        b_modal = W_inv @ self.b
+        gain = None if k_a is None else W_inv[..., :, 0]
+
+        z = np.zeros(eigenvalues.shape)
+        z_start = np.empty((len(times),) + z.shape)
+        for k in range(len(times)):
+            if k > 0:
+                dt = times[k] - times[k - 1]
+                z = propagate_modal(eigenvalues, gain, z, dt) \
+                    + integrate_modal(eigenvalues, gain, b_modal, dt) \
+                    * rates[:, k - 1, None]
+            z = z + b_modal * boluses[:, k, None]
+            z_start[k] = z
+
+        k = np.clip(np.searchsorted(times, self.t_eval, side='right') - 1,
+                    0, len(times) - 1)
+        dt = (self.t_eval - times[k])[None, :, None]
+        eigenvalues = eigenvalues[:, None, :]
+        gain = None if gain is None else gain[:, None, :]
+        z = propagate_modal(eigenvalues, gain, np.swapaxes(z_start[k], 0, 1),
+                            dt) \
+            + integrate_modal(eigenvalues, gain, b_modal[:, None, :], dt) \
+            * rates[:, k, None]
+        return np.einsum('nij,ntj->nit', W, z)
+
+    def ode_solver(self, schedule):
+        '''
+        Integrates the stacked system of all subjects with solve_ivp,
+        piecewise between the union of their dosing events
+        '''
+        import scipy.integrate
+        import scipy.sparse
+        times, boluses, rates = schedule
+        N, n = len(self.population), len(self.b)
+        A = self.A
+
+        def rhs(t, y, rate):
+            q = y.reshape(N, n)
+            return (np.einsum('nij,nj->ni', A, q)
+                    + self.b * rate[:, None]).ravel()
+
+        options = {'rtol': self.rtol, 'atol': self.atol}
+        if self.method == 'LSODA':
+            # the block diagonal Jacobian is banded: LSODA takes it in
+            # packed form, banded[uband + i - j, j] = jac[i, j], instead of
+            # as a dense (N n, N n) matrix
+            banded = np.zeros((2 * n - 1, N * n))
+            r, c = np.meshgrid(np.arange(n), np.arange(n), indexing='ij')
+            columns = np.arange(N)[:, None, None] * n + c
+            banded[n - 1 + r - c, columns] = A
+            options.update(jac=lambda t, y, rate: banded, lband=n - 1,
+                           uband=n - 1)
+        elif self.method in ('Radau', 'BDF'):
+            options['jac'] = scipy.sparse.block_diag(list(A), format='csc')
+
+        bounds = np.append(times, self.tmax)
+        state = np.zeros(N * n)
+        segments = []
+        for k in range(len(times)):
+            state = state + np.outer(boluses[:, k], self.b).ravel()
+            segment = scipy.integrate.solve_ivp(
+                fun=rhs, t_span=[bounds[k], bounds[k + 1]], y0=state,
+                args=(rates[:, k],), dense_output=True, method=self.method,
+                **options)
+            if not segment.success:
+                raise RuntimeError(segment.message)
+            segments.append(segment.sol)
+            state = segment.y[:, -1]
+        y = Trajectory(times, segments, N * n)(self.t_eval)
+        return y.reshape(N, n, len(self.t_eval))
@@ -0,0 +1,269 @@
+#
+# Propagator class
+#
+import functools
+
+import numpy as np
+
+from .model import CompiledModel
+
+
+class Propagator:
+    """Exact propagator of a linear Pharmokinetic (PK) model
+
+    Between dosing events the amounts q in each compartment follow
+    dq/dt = A q + b r, with a constant dose rate r. This class diagonalises
+    A once, so that the state at any time after an event is a closed form
+    sum of exponentials and no ODE integrator is needed.
+
+    The peripheral exchange is symmetric in concentrations, so the
+    intravenous part of A is similar to a symmetric matrix and has real
+    eigenvalues; it is diagonalised with numpy.linalg.eigh. A subcutaneous
+    depot is kept as its own coordinate, with eigenvalue -k_a, which empties
+    into the modal coordinates of the central compartment. Its closed form
+    uses divided differences of exponentials, so it stays exact when -k_a
+    equals (or is close to) an eigenvalue of the intravenous part, where A
+    cannot be diagonalised and the solution has t exp(-k_a t) terms.
+
+    Parameters
+    ----------
+
+    Vc: float
+        central compartment volume
+    CL: float
+        clearance/elimination rate from the central compartment
+    Vps: tuple of floats
+        volumes of the peripheral compartments
+    Qps: tuple of floats
+        transition rates between central and peripheral compartments
+    k_a: float, optional
+        absorption rate of a subcutaneous depot compartment, None for
+        intravenous dosing
+
+    """
+    def __init__(self, Vc, CL, Vps, Qps, k_a=None):
+        model = CompiledModel(Vc, Vps, Qps, CL)
+        eigenvalues, W, W_inv = decompose(model.matrix, model.volumes, k_a)
+
+        self.A, self.b = model.system(k_a)
+        self.eigenvalues = eigenvalues
+        self.W = W
+        self.W_inv = W_inv
+        # the dose input vector in modal coordinates
+        self.b_modal = W_inv @ self.b
+        # modal coordinates of the central compartment, fed by the depot
+        self.gain = None if k_a is None else W_inv[:, 0]
+
+    @property
+    def size(self):
+        """
+        Returns the number of states, including a subcutaneous depot.
+        """
+        return len(self.eigenvalues)
+
+    def propagate(self, z, dt):
+        """
+        Propagates modal coordinates z over a time dt without dosing, see
+        propagate_modal().
+        """
+        return propagate_modal(self.eigenvalues, self.gain, z, dt)
+
+    def integrate(self, z, dt):
+        """
+        Integrates the propagation of modal coordinates z from 0 to dt, see
+        integrate_modal().
+        """
+        return integrate_modal(self.eigenvalues, self.gain, z, dt)
+
+    def evolve_modal(self, z, dt, rate=0.):
+        """
+        Propagates modal coordinates z over a time dt (which may be an
+        array, broadcasting against z) at a constant dose rate.
+        """
+        return self.propagate(z, dt) + rate * self.integrate(self.b_modal, dt)
+
+    def solve(self, schedule, t_eval, y0=None):
+        """
+        Solves the model for a dosing schedule.
+
+        Parameters
+        ----------
+        schedule: tuple (times, boluses, rates)
+            as returned by Protocol.schedule()
+        t_eval: array of floats
+            times at which the solution is returned, in any order
+        y0: array of floats, optional
+            initial amounts before any dose is given, default all zero
+
+        Returns
+        -------
+        y: (n, len(t_eval)) numpy array
+            amounts in each compartment at each time
+        """
+        z_start = self.segment_starts(schedule, y0)
+        return self.evaluate(schedule, z_start, t_eval)
+
+    def segment_starts(self, schedule, y0=None):
+        """
+        Exactly propagates the state from event to event and returns the
+        modal coordinates right after each event, shape (events, n).
+        """
+        times, boluses, rates = schedule
+        z = np.zeros(self.size) if y0 is None else self.W_inv @ y0
+        z_start = np.empty((len(times), self.size))
+        for k in range(len(times)):
+            if k > 0:
+                z = self.evolve_modal(z, times[k] - times[k - 1],
+                                      rates[k - 1])
+            z = z + self.b_modal * boluses[k]
+            z_start[k] = z
+        return z_start
+
+    def evaluate(self, schedule, z_start, t_eval):
+        """
+        Evaluates the solution at all times t_eval in one vectorised step,
+        given the modal state after each event from segment_starts().
+        """
+        times, _, rates = schedule
+        t_eval = np.asarray(t_eval, dtype=float)
+        k = np.clip(np.searchsorted(times, t_eval, side='right') - 1,
+                    0, len(times) - 1)
+        dt = (t_eval - times[k])[:, None]
+        z = self.evolve_modal(z_start[k], dt, rates[k][:, None])
+        return self.W @ z.T
+
+
+def decompose(A_iv, volumes, k_a=None):
+    """
+    Eigendecomposition A = W diag(eigenvalues) W_inv of the transfer matrix.
+
+    With a subcutaneous depot, W and W_inv only diagonalise the intravenous
+    part: the depot is their last coordinate, with eigenvalue -k_a, and
+    W_inv A W also has the column k_a W_inv[..., :, 0] that couples it to
+    the other modes (see propagate_modal). This stays well defined when
+    -k_a is an eigenvalue of the intravenous part.
+
+    Parameters
+    ----------
+    A_iv: (..., n, n) numpy array
+        intravenous transfer matrices, from compartment_matrix()
+    volumes: (..., n) numpy array
+        central and peripheral compartment volumes
+    k_a: float or (...) array, optional
+        absorption rate, if a subcutaneous depot is appended to the system
+
+    Returns
+    -------
+    eigenvalues, W, W_inv: numpy arrays of shape (..., m), (..., m, m) and
+    (..., m, m), with m = n + 1 if there is a depot and n otherwise
+    """
+    # similarity transform to a symmetric matrix
+    root = np.sqrt(volumes)
+    S = A_iv * root[..., None, :] / root[..., :, None]
+    eigenvalues, Q = np.linalg.eigh(S)
+    W = root[..., :, None] * Q
+    W_inv = np.swapaxes(Q, -1, -2) / root[..., None, :]
+    if k_a is None:
+        return eigenvalues, W, W_inv
+
+    # the depot is appended as its own coordinate: W and W_inv are block
+    # diagonal, and the depot empties into the modal coordinates of the
+    # central compartment (see propagate_modal)
+    k_a = np.asarray(k_a, dtype=float)
+    batch = eigenvalues.shape[:-1]
+    W = _append_depot(W)
+    W_inv = _append_depot(W_inv)
+    eigenvalues = np.concatenate(
+        (eigenvalues, np.broadcast_to(-k_a[..., None], batch + (1,))), -1)
+    return eigenvalues, W, W_inv
+
+
+def _append_depot(M):
+    """
+    Appends a last row and column of the identity to (..., n, n) matrices.
+    """
+    n = M.shape[-1]
+    out = np.zeros(M.shape[:-2] + (n + 1, n + 1))
+    out[..., :n, :n] = M
+    out[..., n, n] = 1.
+    return out
+
+
+def propagate_modal(eigenvalues, gain, z, dt):
+    """
+    Returns exp(A dt) z in modal coordinates, broadcasting over z and dt.
+
+    The matrix A is diag(eigenvalues), plus, with a subcutaneous depot (the
+    last coordinate, whose eigenvalue is -k_a), the column k_a gain through
+    which the depot empties into the other coordinates.
+
+    Parameters
+    ----------
+    eigenvalues: (..., m) numpy array
+        eigenvalues, from decompose()
+    gain: (..., m) numpy array or None
+        modal coordinates of the central compartment, W_inv[..., :, 0],
+        with a depot, or None without
+    z: (..., m) numpy array
+        modal coordinates
+    dt: float or numpy array
+        non-negative time steps
+    """
+    y = np.exp(eigenvalues * dt) * z
+    if gain is None:
+        return y
+    k_a = -eigenvalues[..., -1:]
+    return y + k_a * gain * divided_difference(
+        eigenvalues, -k_a, dt) * z[..., -1:]
+
+
+def integrate_modal(eigenvalues, gain, z, dt):
+    """
+    Returns the integral of exp(A s) z for s from 0 to dt in modal
+    coordinates, with the arguments of propagate_modal(). For the dose
+    input vector z = b_modal, this is the response to a unit dose rate.
+    """
+    x = eigenvalues * dt
+    y = dt * phi(x) * z
+    if gain is None:
+        return y
+    return y + gain * (dt * phi(x) - divided_difference(
+        eigenvalues, eigenvalues[..., -1:], dt)) * z[..., -1:]
+
+
+def divided_difference(a, b, t):
+    """
+    Returns (exp(b t) - exp(a t)) / (b - a), continued with t exp(a t) at
+    a = b, for t >= 0. It is evaluated from the larger exponent, so that it
+    neither loses precision nor overflows when a and b are close or far
+    apart.
+    """
+    high = np.maximum(a, b)
+    return t * np.exp(high * t) * phi((np.minimum(a, b) - high) * t)
+
+
+def phi(x):
+    """
+    Returns (exp(x) - 1) / x, continued with 1 at x = 0.
+    """
+    x = np.asarray(x, dtype=float)
+    small = np.abs(x) < 1e-8
+    safe = np.where(small, 1., x)
+    return np.where(small, 1. + x / 2, np.expm1(safe) / safe)
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_propagator(Vc, CL, Vps, Qps, k_a):
+    return Propagator(Vc, CL, Vps, Qps, k_a)
+
+
+def propagator(model, k_a=None):
+    """
+    Returns the (cached) Propagator for the current parameters of a model.
+
+    The decomposition is cached on the parameter values, so repeated solves
+    of the same model with different protocols skip it, while changing the
+    model parameters gives a new decomposition.
+    """
+    return _cached_propagator(*model.snapshot(),
+                              None if k_a is None else float(k_a))
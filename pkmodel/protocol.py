@@ -1,5 +1,11 @@
 import numpy as np
 
+# Width (standard deviation) of the Gaussian that smooths an instantaneous
+# dose in dose_time_function(), and the number of widths beyond which a
+# dose is neglected
+DOSE_WIDTH = 0.02
+DOSE_CUTOFF = 10
+
 
 class Protocol:
     """A Pharmokinetic (PK) protocol
@@ -44,6 +50,12 @@ class Protocol:
         This parameter is a list of numerics that specify the doses of X ng
         given instantaneously at the times specified in the dose_times param.
 
+    regimens: list of tuples, optional, default = [].
+        Periodic instantaneous doses, each given as a block
+        (start, interval, count, amount): count doses of amount ng at times
+        start, start + interval, ... These are stored compactly and never
+        expanded into dose_times / instant_doses.
+
     Methods
     -------
     The method dose_time_function() for a particular time ouputs the dose(t).
@@ -54,20 +66,80 @@ class Protocol:
     modifications require reintialising the object of class Protocol.
     Supported methods are listed below:
 
-    change_dose(), modify_dose_type(), make_continuous(), add_dose()
+    change_dose(), modify_dose_type(), make_continuous(), add_dose(),
+    add_regimen()
 
     """
     def __init__(self, dose_amount=1, subcutaneous=False,
                  k_a=1, continuous=False, continuous_period=[0, 0],
-                 instantaneous=True, dose_times=[0], instant_doses=[1]):
+                 instantaneous=True, dose_times=[0], instant_doses=[1],
+                 regimens=[]):
+        self._changes = 0
+        self._snapshot = None
+        self._sorted = None
         self.subcutaneous = subcutaneous
         self.k_a = k_a
         self.dose_amount = dose_amount
         self.continuous = continuous
         self.instantaneous = instantaneous
-        self.continuous_period = continuous_period
-        self.dose_times = dose_times
-        self.instant_doses = instant_doses
+        # copies, so that protocols do not share the default lists
+        self.continuous_period = list(continuous_period)
+        self.dose_times = list(dose_times)
+        self.instant_doses = list(instant_doses)
+        self.regimens = list(regimens)
+
+    def __setattr__(self, name, value):
+        # count changes of the settings, which invalidate the snapshot
+        if not name.startswith('_'):
+            self._changes += 1
+        super().__setattr__(name, value)
+
+    @property
+    def continuous_period(self):
+        """
+        Start and end times of the continuous dosing.
+        """
+        return self._continuous_period
+
+    @continuous_period.setter
+    def continuous_period(self, continuous_period):
+        self._continuous_period = _TrackedList(continuous_period)
+
+    @property
+    def dose_times(self):
+        """
+        Times of the instantaneous doses.
+        """
+        return self._dose_times
+
+    @dose_times.setter
+    def dose_times(self, dose_times):
+        self._dose_times = _TrackedList(dose_times)
+        self._sorted = None
+
+    @property
+    def instant_doses(self):
+        """
+        Amounts of the instantaneous doses.
+        """
+        return self._instant_doses
+
+    @instant_doses.setter
+    def instant_doses(self, instant_doses):
+        self._instant_doses = _TrackedList(instant_doses)
+        self._sorted = None
+
+    @property
+    def regimens(self):
+        """
+        Periodic dosing blocks (start, interval, count, amount).
+        """
+        return self._regimens
+
+    @regimens.setter
+    def regimens(self, regimens):
+        self._regimens = _TrackedList(regimens)
+        self._blocks = None
 
     def change_dose(self, dose_amount):
         """
@@ -140,31 +212,319 @@ class Protocol:
         self.instant_doses.append(dose)
         self.instantaneous = True
 
-    def dose_time_function(self, t):
+    def add_regimen(self, start, interval, count, amount):
+        """
+
+        Paramater: start: numeric, required
+            Time of the first dose of the regimen.
+        Paramater: interval: numeric, required
+            Time between consecutive doses, e.g. 8 or 12 hours.
+        Paramater: count: int, required
+            Number of doses in the regimen.
+        Paramater: dose: numeric, required
+            The dose in ng given at every time point.
+
+
+        This method modifies an object of class Protocol to add a periodic
+        block of count instantaneous doses, stored as a single
+        (start, interval, count, amount) entry of regimens however long it
+        runs. The method also specifies that instantaneous dosing does
+        happen should it not already be specified.
+
+        """
+        if interval <= 0 or count < 0:
+            raise ValueError('interval should be positive and count '
+                             'non-negative')
+        self.regimens.append((start, interval, int(count), amount))
+        self.instantaneous = True
+
+    def regimen_blocks(self):
+        """
+
+        Returns: tuple of numpy arrays (starts, intervals, counts, amounts).
+            The regimens as arrays, kept between calls, and recomputed when
+        regimens is reassigned or changed in place.
+
+        """
+        changes = self._regimens.changes
+        if self._blocks is None or self._blocks[0] != changes:
+            blocks = np.asarray(self.regimens, dtype=float).reshape(-1, 4)
+            self._blocks = changes, tuple(blocks.T.copy())
+        return self._blocks[1]
+
+    def doses_between(self, t0, t1):
+        """
+
+        Paramater: t0, t1: numeric, required.
+            The time interval [t0, t1).
+
+        Returns: tuple of numpy arrays (times, amounts).
+            All instantaneous doses, from dose_times and from the regimens,
+        given in [t0, t1), sorted by time. Regimens are only expanded over
+        the requested interval.
+
+        """
+        if not self.instantaneous:
+            return np.zeros(0), np.zeros(0)
+        times, doses = self.sorted_doses()
+        lo, hi = np.searchsorted(times, [t0, t1])
+        all_times, all_doses = [times[lo:hi]], [doses[lo:hi]]
+        for start, interval, count, amount in zip(*self.regimen_blocks()):
+            first = max(0, int(np.ceil(_snap((t0 - start) / interval))))
+            last = min(int(count),
+                       int(np.ceil(_snap((t1 - start) / interval))))
+            k = np.arange(first, max(first, last))
+            all_times.append(start + k * interval)
+            all_doses.append(np.full(len(k), amount))
+        times = np.concatenate(all_times)
+        doses = np.concatenate(all_doses)
+        order = np.argsort(times, kind='stable')
+        return times[order], doses[order]
+
+    def next_dose(self, t):
+        """
+
+        Paramater: t: numeric, required.
+
+        Returns: tuple (time, amount) or None.
+            The first instantaneous dose given at or after t, with the total
+        amount given at that time, or None if there is none. The cost is
+        logarithmic in the number of listed doses and constant per regimen.
+
+        """
+        return self._nearest_dose(t, after=True)
+
+    def active_dose(self, t):
         """
 
         Paramater: t: numeric, required.
-            The time at which you want dose(t) to be returned.
 
-        Returns: numeric.
+        Returns: tuple (time, amount) or None.
+            The last instantaneous dose given at or before t, with the total
+        amount given at that time, or None if there is none.
+
+        """
+        return self._nearest_dose(t, after=False)
+
+    def _nearest_dose(self, t, after):
+        if not self.instantaneous:
+            return None
+        candidates = []
+        times, doses = self.sorted_doses()
+        if after:
+            i = np.searchsorted(times, t, side='left')
+            if i < len(times):
+                candidates.append(times[i])
+        else:
+            i = np.searchsorted(times, t, side='right') - 1
+            if i >= 0:
+                candidates.append(times[i])
+
+        starts, intervals, counts, _ = self.regimen_blocks()
+        valid = counts > 0
+        position = _snap((t - starts) / intervals)
+        if after:
+            k = np.maximum(np.ceil(position), 0)
+            valid &= k < counts
+        else:
+            k = np.minimum(np.floor(position), counts - 1)
+            valid &= k >= 0
+        candidates.extend((starts + k * intervals)[valid])
+
+        if not candidates:
+            return None
+        time = min(candidates) if after else max(candidates)
+        # the listed doses at that time are a run of the sorted times
+        amount = doses[np.searchsorted(times, time, side='left'):
+                       np.searchsorted(times, time, side='right')].sum()
+        position = _snap((time - starts) / intervals)
+        on_grid = ((position == np.round(position)) & (position >= 0)
+                   & (position < counts))
+        amount += self.regimen_blocks()[3][on_grid].sum()
+        return float(time), float(amount)
+
+    def snapshot(self):
+        """
+
+        Returns: tuple.
+            A canonical, hashable snapshot of the dosing protocol. Settings
+        that have no effect (k_a for intravenous dosing, the continuous
+        period when dosing is not continuous, the instantaneous doses when
+        instantaneous is False) are left out, and the instantaneous doses are
+        sorted by time, so protocols that dose the same way have equal
+        snapshots. The snapshot is kept until a setting or one of the lists
+        changes.
+
+        """
+        changes = (self._changes, self._continuous_period.changes,
+                   self._dose_times.changes, self._instant_doses.changes,
+                   self._regimens.changes)
+        if self._snapshot is None or self._snapshot[0] != changes:
+            self._snapshot = changes, self._make_snapshot()
+        return self._snapshot[1]
+
+    def _make_snapshot(self):
+        subcutaneous = bool(self.subcutaneous)
+        k_a = float(self.k_a) if subcutaneous else None
+        continuous = None
+        if self.continuous:
+            continuous = (float(self.dose_amount),
+                          tuple(float(t) for t in self.continuous_period[:2]))
+        doses, regimens = (), ()
+        if self.instantaneous:
+            doses = tuple(sorted((float(t), float(d)) for d, t in
+                                 zip(self.instant_doses, self.dose_times)))
+            regimens = tuple(sorted(
+                (float(start), float(interval), int(count), float(amount))
+                for start, interval, count, amount in self.regimens
+                if count > 0))
+        return subcutaneous, k_a, continuous, doses, regimens
+
+    def schedule(self, tmax):
+        """
+
+        Paramater: tmax: numeric, required.
+            The end of the time horizon.
+
+        Returns: tuple of numpy arrays (times, boluses, rates).
+            times are the sorted times in [0, tmax) at which the dosing
+        changes, starting with 0. boluses are the instantaneous doses given
+        at each of these times, and rates the continuous dose rate that
+        holds from each time until the next one (or tmax).
+
+
+        Unlike dose_time_function(), instantaneous doses are not smoothed,
+        so solvers can apply them as exact jumps of the dosed compartment
+        and integrate the piecewise constant rate in between.
+
+        """
+        dose_times, instant_doses = self.doses_between(0, tmax)
+
+        events = [[0.], dose_times]
+        if self.continuous:
+            events.append([t for t in self.continuous_period[:2]
+                           if 0 < t < tmax])
+        times = np.unique(np.concatenate(events))
+
+        boluses = np.zeros(len(times))
+        np.add.at(boluses, np.searchsorted(times, dose_times), instant_doses)
+
+        rates = np.zeros(len(times))
+        if self.continuous:
+            start, stop = self.continuous_period[:2]
+            rates[(times >= start) & (times < stop)] = self.dose_amount
+        return times, boluses, rates
+
+    def sorted_doses(self):
+        """
+
+        Returns: tuple of numpy arrays (dose_times, instant_doses).
+            The instantaneous doses sorted by time. These are kept between
+        calls, and recomputed when dose_times or instant_doses are
+        reassigned or changed in place.
+
+        """
+        changes = (self._dose_times.changes, self._instant_doses.changes)
+        if self._sorted is None or self._sorted[0] != changes:
+            n = min(len(self.dose_times), len(self.instant_doses))
+            times = np.asarray(self.dose_times[:n], dtype=float)
+            doses = np.asarray(self.instant_doses[:n], dtype=float)
+            order = np.argsort(times, kind='stable')
+            self._sorted = changes, (times[order], doses[order])
+        return self._sorted[1]
+
+    def dose_time_function(self, t):
+        """
+
+        Paramater: t: numeric or numpy array, required.
+            The time(s) at which you want dose(t) to be returned. Arrays of
+            any shape are evaluated element-wise, e.g. (subjects, times).
+
+        Returns: numeric or numpy array of the same shape as t.
             Dose(t) for the specific dosing protocol set up in the object
         of class Protocol.
 
+
+        Each instantaneous dose is smoothed into a Gaussian of width
+        DOSE_WIDTH. Only the doses within DOSE_CUTOFF widths of each time
+        are evaluated, and these are found by binary search in the sorted
+        dose times, so the cost does not grow with the number of doses.
+
         """
-        dose_t_continuous, dose_t_instant = 0, 0
-        dose_width = 0.02
+        t_array = np.asarray(t, dtype=float)
+        dose_t = np.zeros(t_array.shape)
+
+        if self.continuous:
+            start, stop = self.continuous_period[:2]
+            dose_t += np.where((t_array >= start) & (t_array < stop),
+                               self.dose_amount, 0)
+
+        times, doses = self.sorted_doses()
+        if self.instantaneous and len(times):
+            reach = DOSE_CUTOFF * DOSE_WIDTH
+            first = np.searchsorted(times, t_array - reach)
+            last = np.searchsorted(times, t_array + reach, side='right')
+            for j in range(int(np.max(last - first, initial=0))):
+                index = first + j
+                near = index < last
+                index = np.where(near, index, 0)
+                dose_t += np.where(
+                    near, easy_gaus(t_array, times[index], DOSE_WIDTH)
+                    * doses[index], 0)
+
+        if self.instantaneous:
+            reach = DOSE_CUTOFF * DOSE_WIDTH
+            for start, interval, count, amount in zip(*self.regimen_blocks()):
+                # the doses of the regimen within reach of each time
+                first = np.maximum(
+                    np.ceil((t_array - reach - start) / interval), 0)
+                last = np.minimum(
+                    np.floor((t_array + reach - start) / interval), count - 1)
+                for j in range(int(np.max(last - first, initial=-1)) + 1):
+                    k = first + j
+                    dose_t += np.where(
+                        k <= last, easy_gaus(t_array, start + k * interval,
+                                             DOSE_WIDTH) * amount, 0)
+
+        if np.ndim(t) == 0:
+            return dose_t.item()
+        return dose_t
 
-        for dose_size, dose_time in zip(self.instant_doses,
-                                        self.dose_times):
-            dose_t_instant += easy_gaus(t, dose_time, dose_width) * dose_size \
-                * self.instantaneous
 
-        if self.continuous and t < self.continuous_period[1] and \
-           t >= self.continuous_period[0]:
-            dose_t_continuous = self.dose_amount
+def _snap(position):
+    """
+    Rounds positions (t - start) / interval in a regimen that are within
+    rounding error of a whole number k of intervals to k, so that a time
+    computed as start + k * interval counts as the time of dose k.
+    """
+    nearest = np.round(position)
+    return np.where(np.isclose(position, nearest, rtol=1e-9, atol=1e-9),
+                    nearest, position)
 
-        dose_t = dose_t_continuous + dose_t_instant
-        return dose_t
+
+class _TrackedList(list):
+    """
+    A list that counts its in-place changes, so that the arrays a Protocol
+    derives from its dose lists are recomputed after e.g. an append().
+    """
+    changes = 0
+
+
+def _counted(name):
+    method = getattr(list, name)
+
+    def mutator(self, *args, **kwargs):
+        self.changes += 1
+        return method(self, *args, **kwargs)
+    mutator.__name__ = name
+    mutator.__doc__ = method.__doc__
+    return mutator
+
+
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort',
+              'reverse'):
+    setattr(_TrackedList, _name, _counted(_name))
 
 
 def easy_gaus(x, mean, std):
@@ -0,0 +1,114 @@
+#
+# Result class
+#
+import os
+
+import numpy as np
+
+
+class Result:
+    """A lean solution: the time grid and the trajectories, nothing else
+
+    Holds only what is needed downstream of a solve, optionally in single
+    precision, and saves to and loads from numpy files that can be memory
+    mapped, so that large result sets are opened without being read into
+    memory. Made by Solution.result() and PopulationSolution.result().
+
+    Parameters
+    ----------
+
+    t: array of floats, shape (nsteps,)
+        time points
+    y: array of floats, shape (..., compartments, nsteps)
+        drug quantity in each compartment at each time point, with leading
+        dimensions for populations or scenarios
+    dtype: numpy dtype, optional
+        dtype to store t and y in, e.g. numpy.float32 to halve the memory.
+        default value keeps the dtype of y
+
+    """
+    __slots__ = ('t', 'y')
+
+    def __init__(self, t, y, dtype=None):
+        y = np.asarray(y, dtype=dtype)
+        t = np.asarray(t, dtype=y.dtype if dtype is not None else None)
+        if y.shape[-1:] != t.shape:
+            raise ValueError('The last dimension of y should be the times')
+        self.t = t
+        self.y = y
+
+    def __len__(self):
+        return len(self.t)
+
+    @property
+    def nbytes(self):
+        """
+        Memory held by t and y, in bytes.
+        """
+        return self.t.nbytes + self.y.nbytes
+
+    def save(self, path):
+        """
+        Saves the result. A path ending in '.npz' gives a single
+        uncompressed archive; any other path is a directory holding t.npy
+        and y.npy. Both can be memory mapped by load().
+        """
+        path = os.fspath(path)
+        if path.endswith('.npz'):
+            np.savez(path, t=self.t, y=self.y)
+        else:
+            os.makedirs(path, exist_ok=True)
+            np.save(os.path.join(path, 't.npy'), self.t)
+            np.save(os.path.join(path, 'y.npy'), self.y)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Loads a result saved by save(). With a mmap_mode ('r', 'r+' or
+        'c', as numpy.load), the arrays are memory mapped from the file
+        instead of read into memory; mmap_mode=None reads them.
+        """
+        path = os.fspath(path)
+        if path.endswith('.npz'):
+            arrays = _load_npz(path, mmap_mode)
+        else:
+            arrays = {name: np.load(os.path.join(path, name + '.npy'),
+                                    mmap_mode=mmap_mode)
+                      for name in ('t', 'y')}
+        result = cls.__new__(cls)
+        result.t = arrays['t']
+        result.y = arrays['y']
+        return result
+
+
+def _load_npz(path, mmap_mode):
+    """
+    Loads the arrays of an npz archive. Members stored without compression
+    are memory mapped at their offset in the archive.
+    """
+    import zipfile
+    if mmap_mode is None:
+        with np.load(path) as archive:
+            return {name: archive[name] for name in archive.files}
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError('Compressed archives cannot be memory mapped')
+            # the data follows the local file header, whose variable
+            # length fields may differ from those of the central directory
+            f.seek(info.header_offset + 26)
+            name_length, extra_length = np.frombuffer(f.read(4), '<u2')
+            f.seek(info.header_offset + 30 + int(name_length)
+                   + int(extra_length))
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran, dtype = \
+                    np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran, dtype = \
+                    np.lib.format.read_array_header_2_0(f)
+            arrays[info.filename[:-len('.npy')]] = np.memmap(
+                path, dtype=dtype, mode=mmap_mode, offset=f.tell(),
+                shape=shape, order='F' if fortran else 'C')
+    return arrays
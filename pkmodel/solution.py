@@ -1,14 +1,26 @@
 #
 # Solution class
 #
+import functools
+import time
+
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.integrate
+
+from .cache import solution_cache
+from .model import (CompiledModel, Model, compartment_matrix,
+                    matrix_derivatives)
+from .propagator import propagator
+from .result import Result
+from .stats import SolveStats, notify, rejected_steps
 
 
 class Solution:
     """A Pharmokinetic (PK) model solution
 
+    The model is solved on first access to the results (sol, at(), the
+    plotting methods), and the result is reused until the parameters of
+    the model or protocol change.
+
     Parameters
     ----------
 
@@ -30,17 +42,165 @@ class Solution:
         number of integration steps
         default value is 1000
 
+    method: str
+        integration method passed to scipy.integrate.solve_ivp, one of
+        'RK45', 'RK23', 'DOP853', 'Radau', 'BDF' or 'LSODA'. The implicit
+        methods ('Radau', 'BDF', 'LSODA') are given the analytic Jacobian,
+        and should be used for stiff models with fast inter-compartment
+        transfer and slow clearance.
+        default value is 'RK45'
+
+    engine: str
+        'ode' integrates the model numerically with method.
+        'exact' uses the closed form solution of the linear model from the
+        (cached) eigendecomposition of its transfer matrix, with
+        instantaneous doses applied as exact jumps.
+        default value is 'ode'
+
+    cache: bool
+        if True, results are shared through the process-wide LRU cache
+        pkmodel.cache.solution_cache, so that solving the same model and
+        protocol again is a dictionary lookup. The arrays of cached results
+        (sol.y and sol.sensitivities) are shared, and therefore read-only.
+        default value is False
+
+    sensitivities: bool
+        if True, the forward sensitivity equations are integrated alongside
+        the state (with the 'ode' engine), and sol.sensitivities holds the
+        derivatives of the drug quantities to each model parameter, of shape
+        (parameters, compartments, nsteps). The parameters are listed in
+        sol.parameter_names: 'Vc', 'CL', 'Vp1', 'Qp1', ..., and 'k_a' for
+        subcutaneous dosing.
+        default value is False
+
+    hooks: list of callables
+        callbacks called as hook(solution, stats) after every solve of this
+        Solution, in addition to those registered with
+        pkmodel.stats.add_hook(). The statistics of the last solve are also
+        kept in solution.stats (see pkmodel.stats.SolveStats).
+        default value is no hooks
+
+    rtol, atol: float
+        relative and absolute tolerances of the 'ode' engine, passed to
+        scipy.integrate.solve_ivp. The 'exact' engine does not use them.
+        default values are 1e-3 and 1e-6
+
     """
-    def __init__(self, model, protocol, tmax=1, nsteps=1000):
+    methods = ('RK45', 'RK23', 'DOP853', 'Radau', 'BDF', 'LSODA')
+    implicit_methods = ('Radau', 'BDF', 'LSODA')
+    engines = ('ode', 'exact')
+
+    def __init__(self, model, protocol, tmax=1, nsteps=1000, method='RK45',
+                 engine='ode', cache=False, sensitivities=False, hooks=(),
+                 rtol=1e-3, atol=1e-6):
+        if method not in self.methods:
+            raise ValueError('method should be one of ' + str(self.methods))
+        if engine not in self.engines:
+            raise ValueError('engine should be one of ' + str(self.engines))
+        if sensitivities and engine != 'ode':
+            raise ValueError('sensitivities are integrated by the ode engine')
         self.model = model
         self.protocol = protocol
         self.t_eval = np.linspace(0, tmax, nsteps)
         self.tmax = tmax
         self.nsteps = nsteps
-
+        self.method = method
+        self.engine = engine
+        self.cache = cache
+        self.sensitivities = sensitivities
+        self.hooks = list(hooks)
+        self.rtol = rtol
+        self.atol = atol
+        self.stats = None
+
+        # solved lazily, on first access to the results
+        self._sol = None
+        self._solved_for = None
+
+    def fingerprint(self):
+        """
+        Returns a hashable key made of the snapshots of the model and
+        protocol, and the solver settings. The stored solution is reused as
+        long as this does not change, and is shared through the process-wide
+        solution cache with other Solutions that have the same key. The
+        model and protocol keep their snapshots until they change, so the
+        key is checked on every access without rebuilding them.
+        """
+        return (self.model.snapshot(), self.protocol.snapshot(),
+                self.tmax, self.nsteps, self.method, self.engine,
+                self.sensitivities, self.rtol, self.atol)
+
+    def _ensure_solved(self):
+        key = self.fingerprint()
+        if self._sol is not None and self._solved_for == key:
+            return
+        cached = solution_cache.get(key) if self.cache else None
+        if cached is not None:
+            self._sol, self._y0, self._trajectory = cached
+            self._solved_for = key
+            self.stats = SolveStats(self.engine, self.method, cached=True)
+            notify(self, self.stats)
+            return
         self.solver()
+        if self.cache:
+            self._sol.y.flags.writeable = False
+            if self.sensitivities:
+                self._sol.sensitivities.flags.writeable = False
+            solution_cache.put(key, (self._sol, self._y0, self._trajectory))
+
+    @property
+    def sol(self):
+        """
+        The solution on the grid t_eval, computed on first access and
+        recomputed only after the model or protocol changed.
+        """
+        self._ensure_solved()
+        return self._sol
+
+    @property
+    def y0(self):
+        """
+        Initial condition of the solution.
+        """
+        self._ensure_solved()
+        return self._y0
+
+    @property
+    def trajectory(self):
+        """
+        Continuous solution, evaluated by at().
+        """
+        self._ensure_solved()
+        return self._trajectory
 
-    def rhs_intravenous(self, t, y):
+    def compile(self):
+        """
+        Compiles the model into a transfer matrix and an input vector, so
+        that the right hand side is a single matrix-vector product.
+        Called once per solve, not per right hand side evaluation.
+        With sensitivities, these are the matrix and input vector of the
+        state augmented with its derivatives to each parameter.
+        """
+        k_a = self.protocol.k_a if self.protocol.subcutaneous else None
+        if isinstance(self.model, (Model, CompiledModel)):
+            # reuse the precomputed matrix of the compiled model
+            self.A, self.b = self.model.compile().system(k_a)
+        else:
+            self.A, self.b = compartment_matrix(self.model, k_a)
+
+        if self.sensitivities:
+            # augment the state q with s_j = dq/dtheta_j, which follow
+            # ds_j/dt = A s_j + dA/dtheta_j q
+            names, dA = matrix_derivatives(self.model, k_a)
+            n = len(self.b)
+            A = np.kron(np.eye(len(names) + 1), self.A)
+            A[n:, :n] = dA.reshape(-1, n)
+            self.A = A
+            self.b = np.concatenate((self.b, np.zeros(n * len(names))))
+            self.parameter_names = names
+        return self.A, self.b
+
+    def rhs_intravenous(self, t, y, rate=0.):
         '''
         Right hand side of flux equation for intravenous dosing protocol
         dimension of system = number of compartments = self.model.size
@@ -51,93 +211,307 @@ class Solution:
         ----------
         t: time
         y: state vector [qc, q_p1, q_p2]
+        rate: continuous dose rate, constant between dosing events
         '''
-        state = y
-        Vc = self.model.Vc  # volume of the main compartment
-        CL = self.model.CL  # Clearance rate
-
-        cleared = state[0] / Vc * CL  # flux going out of the main compartment
-        dq_dt = [0]  # [dqc, dq_p1, dq_p2]
-
-        flux_sum = 0  # sum of flux between compartments
-        # loop over peripheral compartments
-        for comp in range(1, self.model.size):
-            # transition rate etween main compartment
-            # and i-th peripheral compartment
-            Q_pi = self.model.Qps[comp - 1]
-            # volume of i-th peripheral compartment
-            V_pi = self.model.Vps[comp - 1]
-            # flux between peripheral and main compartment
-            flux = Q_pi * (state[0] / Vc - state[comp] / V_pi)
-            dq_dt.append(flux)
-            flux_sum += flux
-        dq_dt[0] = self.protocol.dose_time_function(t) - cleared - flux_sum
-        return dq_dt
-
-    def rhs_subcutaneous(self, t, y):
+        return self.A @ y + self.b * rate
+
+    def rhs_subcutaneous(self, t, y, rate=0.):
         '''
         Right hand side of flux equation for subcutaneous dosing protocol
         dimension of system = number of compartments = self.model.size
         Parameters
         ----------
         t: time
-        y: state vector [q0, qc, q_p1, q_p2]
+        y: state vector [qc, q_p1, q_p2, q0]
+        rate: continuous dose rate, constant between dosing events
         y has one dim more than in intravenous protocol
         q0 is an additional compartment from which the drug
         is absorbed to the central compartment
         '''
-        state = y
-        Vc = self.model.Vc  # volume of the main compartment
-        CL = self.model.CL  # Clearance rate
-
-        cleared = state[0] / Vc * CL  # flux going out of the main compartment
-        dq_dt = np.zeros(self.model.size + 1)  # [dqc, dq_p1, dq_p2, dq0]
-        dq0_dt = self.protocol.dose_time_function(t)
-        dq0_dt -= self.protocol.k_a * state[-1]
-        dq_dt[-1] = dq0_dt
-
-        flux_sum = 0  # sum of flux between compartments
-        # loop over peripheral compartments
-        for comp in range(1, self.model.size):
-            # transition rate etween main compartment
-            # and i-th peripheral compartment
-            Q_pi = self.model.Qps[comp - 1]
-            # volume of i-th peripheral compartment
-            V_pi = self.model.Vps[comp - 1]
-            flux = Q_pi * (state[0] / Vc - state[comp] / V_pi)
-            dq_dt[comp] = flux
-            flux_sum += flux
-        dq_dt[0] = self.protocol.k_a * state[-1] - cleared - flux_sum
-        return dq_dt
+        return self.A @ y + self.b * rate
+
+    def jacobian(self, t=None, y=None, rate=0.):
+        '''
+        Jacobian of the right hand side. The system is linear with constant
+        coefficients, so this is the compiled transfer matrix for any t, y.
+        '''
+        return self.A
+
+    @property
+    def jac_sparsity(self):
+        '''
+        Sparsity pattern of the Jacobian: the central compartment couples to
+        every other compartment, the peripheral compartments only to the
+        central one (and themselves).
+        '''
+        return self.A != 0
 
     def solver(self):
         '''
-        Runge-Kutta solver
+        Solver using the integration method set by self.method
+        (Runge-Kutta by default), or the exact propagator if
+        self.engine is 'exact'
         Dosing protocol specified in protocol class
         determines which rhs function will be used
         '''
+        if self.engine == 'exact':
+            return self.exact_solver()
+        import scipy.integrate
+        import scipy.optimize
+
+        stats = SolveStats(self.engine, self.method)
+        start = time.perf_counter()
+        self.compile()
         if self.protocol.subcutaneous:
             step_func = self.rhs_subcutaneous
             # subcutaneous protocol has one more dimension
             # than intravenous protocol
-            # initial condition y0
-            self.y0 = np.zeros(self.model.size + 1)
-            self.sol = np.zeros(self.model.size + 1)
+            n = self.model.size + 1
         else:
             step_func = self.rhs_intravenous
-            # intial condition
-            self.y0 = np.zeros(self.model.size)
-            self.sol = np.zeros(self.model.size)
-
-        sol = scipy.integrate.solve_ivp(
-            fun=lambda t, y: step_func(t, y),
-            t_span=[self.t_eval[0], self.t_eval[-1]],
-            y0=self.y0, t_eval=self.t_eval,
-            max_step=self.tmax / self.nsteps
-        )
-        self.sol = sol
+            n = self.model.size
+        # initial condition y0, including the sensitivities if any
+        y0 = np.zeros(len(self.b))
+
+        options = self._ode_options()
+
+        # integrate piecewise between dosing events, applying instantaneous
+        # doses as jumps, so that steps are only limited by the accuracy
+        times, boluses, rates = self.protocol.schedule(self.tmax)
+        stats.dose_calls += 1
+        bounds = np.append(times, self.tmax)
+        state = y0
+        segments = []
+        nfev, njev, nlu = 0, 0, 0
+        integration = time.perf_counter()
+        stats.setup = integration - start
+        for k in range(len(times)):
+            state = state + self.b * boluses[k]
+            segment = scipy.integrate.solve_ivp(
+                fun=step_func, t_span=[bounds[k], bounds[k + 1]],
+                y0=state, args=(rates[k],), dense_output=True,
+                method=self.method, **options
+            )
+            if not segment.success:
+                raise RuntimeError(segment.message)
+            segments.append(segment.sol)
+            state = segment.y[:, -1]
+            nfev += segment.nfev
+            njev += segment.njev
+            nlu += segment.nlu
+            stats.steps += len(segment.t) - 1
+            rejected = rejected_steps(self.method, segment.nfev,
+                                      len(segment.t) - 1)
+            if rejected is not None:
+                stats.rejected_steps = (stats.rejected_steps or 0) + rejected
+        output = time.perf_counter()
+        stats.integration = output - integration
+        stats.segments = len(times)
+        stats.rhs_calls, stats.jacobian_calls = nfev, njev
+        stats.lu_decompositions = nlu
+        trajectory = Trajectory(times, segments, len(state))
+        y = trajectory(self.t_eval)
+
+        sol = scipy.optimize.OptimizeResult(
+            t=self.t_eval, y=y[:n], nfev=nfev, njev=njev, nlu=nlu, status=0,
+            message='The solver successfully reached the end of the '
+                    'integration interval.', success=True)
+        if self.sensitivities:
+            sol.sensitivities = y[n:].reshape(-1, n, len(self.t_eval))
+            sol.parameter_names = self.parameter_names
+            sol.sensitivity_trajectory = functools.partial(
+                _sensitivity_rows, trajectory, n)
+            trajectory = functools.partial(_first_rows, trajectory, n)
+        stats.output = time.perf_counter() - output
+        return self._store(sol, y0[:n], trajectory, stats)
+
+    def _ode_options(self):
+        '''
+        Options of solve_ivp for the compiled system
+        '''
+        import scipy.sparse
+        options = {'rtol': self.rtol, 'atol': self.atol}
+        if self.method in self.implicit_methods:
+            # constant analytic Jacobian, stored sparse so that the implicit
+            # solvers only factorise the non-zero pattern (LSODA only takes
+            # a callable returning a dense matrix)
+            if self.method == 'LSODA':
+                options['jac'] = self.jacobian
+            else:
+                options['jac'] = scipy.sparse.csc_matrix(self.A)
+        return options
+
+    def stream(self, chunk_size=10000):
+        '''
+        Solves the model in time chunks, yielding the solution on t_eval
+        block by block, so that memory is bounded by the chunk size rather
+        than by nsteps. The state is carried exactly across chunk
+        boundaries, and the blocks concatenate to sol.t and sol.y. Nothing
+        is stored on the Solution.
+
+        :param chunk_size: number of time points per block
+        :returns: generator of (t, y) blocks, t of shape (points,) and y of
+        shape (compartments, points)
+        '''
+        if chunk_size < 1:
+            raise ValueError('chunk_size should be positive')
+        stepper = (self._exact_stepper() if self.engine == 'exact'
+                   else self._ode_stepper())
+        schedule = self.protocol.schedule(self.tmax)
+        step = self.tmax / (self.nsteps - 1) if self.nsteps > 1 else 0.
+        # current time, dose rate, index of the next event and state
+        carry = (0., 0., 0, np.zeros(len(stepper[0])))
+        for start in range(0, self.nsteps, chunk_size):
+            stop = min(start + chunk_size, self.nsteps)
+            t = np.arange(start, stop) * step
+            if stop == self.nsteps:
+                # as numpy.linspace, so that the blocks match t_eval
+                t[-1] = self.tmax
+            y, carry = _stream_block(stepper, schedule, t, carry)
+            yield t, y
+
+    def _exact_stepper(self):
+        '''
+        Steps of stream() for the exact engine, in modal coordinates
+
+        :returns: (b, n, advance, output), the dose input vector, the
+        number of outputs, advance(state, t0, t1, rate, points) returning
+        the outputs at points in [t0, t1) and the state at t1, and
+        output(state)
+        '''
+        k_a = self.protocol.k_a if self.protocol.subcutaneous else None
+        exact = propagator(self.model, k_a)
+
+        def advance(state, t0, t1, rate, points):
+            z = exact.evolve_modal(state, (points - t0)[:, None], rate)
+            return exact.W @ z.T, exact.evolve_modal(state, t1 - t0, rate)
+
+        def output(state):
+            return exact.W @ state
+        return exact.b_modal, exact.size, advance, output
+
+    def _ode_stepper(self):
+        '''
+        Steps of stream() for the ODE engine, as _exact_stepper()
+        '''
+        import scipy.integrate
+        self.compile()
+        step_func = (self.rhs_subcutaneous if self.protocol.subcutaneous
+                     else self.rhs_intravenous)
+        n = self.model.size + bool(self.protocol.subcutaneous)
+        options = self._ode_options()
+
+        def advance(state, t0, t1, rate, points):
+            segment = scipy.integrate.solve_ivp(
+                fun=step_func, t_span=[t0, t1], y0=state,
+                args=(rate,), t_eval=np.append(points, t1),
+                method=self.method, **options)
+            if not segment.success:
+                raise RuntimeError(segment.message)
+            return segment.y[:n, :-1], segment.y[:, -1]
+
+        def output(state):
+            return state[:n]
+        return self.b, n, advance, output
+
+    def exact_solver(self):
+        '''
+        Exact solver for the linear model: propagates the state from
+        dosing event to dosing event with the matrix exponential and
+        evaluates the whole output grid in one vectorised step
+        '''
+        import scipy.optimize
+        stats = SolveStats(self.engine, self.method)
+        start = time.perf_counter()
+        k_a = self.protocol.k_a if self.protocol.subcutaneous else None
+        exact = propagator(self.model, k_a)
+        y0 = np.zeros(exact.size)
+        schedule = self.protocol.schedule(self.tmax)
+        stats.dose_calls += 1
+        integration = time.perf_counter()
+        z_start = exact.segment_starts(schedule, y0)
+        output = time.perf_counter()
+        trajectory = functools.partial(exact.evaluate, schedule, z_start)
+        y = trajectory(self.t_eval)
+        sol = scipy.optimize.OptimizeResult(
+            t=self.t_eval, y=y, nfev=0, njev=0, nlu=0, status=0,
+            message='Exact solution of the linear model.', success=True)
+        stats.setup = integration - start
+        stats.integration = output - integration
+        stats.output = time.perf_counter() - output
+        stats.segments = len(schedule[0])
+        return self._store(sol, y0, trajectory, stats)
+
+    def _store(self, sol, y0, trajectory, stats):
+        '''
+        Keeps the result of a solve, with the parameters it was solved for,
+        and passes its statistics to the hooks
+        '''
+        self._sol = sol
+        self._y0 = y0
+        self._trajectory = trajectory
+        self._solved_for = self.fingerprint()
+        self.stats = stats
+        notify(self, stats)
         return sol
 
+    def at(self, times):
+        '''
+        Drug quantity per compartment at arbitrary times, evaluated from the
+        dense output of the last solve (or the exact propagator) without
+        integrating again
+
+        :param times: time or array of times in [0, tmax], in any order
+        :returns: array of shape (compartments, len(times)), or
+        (compartments,) for a single time
+        '''
+        t = np.asarray(times, dtype=float)
+        if np.any(t < 0) or np.any(t > self.tmax):
+            raise ValueError('times should be within [0, tmax]')
+        y = self.trajectory(np.atleast_1d(t).ravel())
+        return y.reshape(y.shape[:1] + t.shape)
+
+    def result(self, dtype=None):
+        '''
+        The solution on t_eval as a lean Result, without the solver
+        details, model and protocol
+
+        :param dtype: dtype of the result, e.g. numpy.float32
+        :returns: Result
+        '''
+        return Result(self.sol.t, self.sol.y, dtype=dtype)
+
+    def sensitivity_at(self, times):
+        '''
+        Derivatives of the drug quantity per compartment to each model
+        parameter at arbitrary times, for a Solution with sensitivities
+
+        :param times: time or array of times in [0, tmax], in any order
+        :returns: array of shape (parameters, compartments, len(times)), or
+        (parameters, compartments) for a single time
+        '''
+        if not self.sensitivities:
+            raise ValueError('The Solution has no sensitivities')
+        t = np.asarray(times, dtype=float)
+        if np.any(t < 0) or np.any(t > self.tmax):
+            raise ValueError('times should be within [0, tmax]')
+        s = self.sol.sensitivity_trajectory(np.atleast_1d(t).ravel())
+        return s.reshape(s.shape[:2] + t.shape)
+
+    def concentration(self, times):
+        '''
+        Drug concentration in the central and peripheral compartments at
+        arbitrary times, i.e. at(times) divided by the compartment volumes
+        (the subcutaneous depot has no volume and is left out)
+
+        :param times: time or array of times in [0, tmax], in any order
+        :returns: array of shape (model.size, len(times)), or
+        (model.size,) for a single time
+        '''
+        volumes = np.concatenate(([self.model.Vc], self.model.Vps))
+        q = self.at(times)[:len(volumes)]
+        return q / volumes.reshape((-1,) + (1,) * (q.ndim - 1))
+
     def plot(self, separate=False):
         """
         Generate a figure of the drug quantity per
@@ -146,42 +520,8 @@ class Solution:
         :param separate: set to True if you want 1 plot per compartment
         :returns: matplotlib figure
         """
-        sol = self.solver()
-        n = self.model.size
-        if separate:
-            fig = plt.figure(figsize=(n * 4.0, 3.0))
-            central = fig.add_subplot(1, n, 1)
-            central.plot(sol.t, sol.y[0, :], label='- q_c')
-            central.legend()
-            central.set_title('Central compartment')
-        else:
-            fig = plt.figure(figsize=(4.0, 3.0))
-            model = fig.add_subplot(1, 1, 1)
-            model.plot(sol.t, sol.y[0, :], label='- q_c')
-
-        # add legend and axes labels
-        plt.ylabel('drug mass [ng]')
-        plt.xlabel('time [h]')
-
-        # loop over peripheral compartments and plot drug quantity for each
-        for i in range(n - 1):
-            label = '- q_p' + str(i + 2)
-            if separate:
-                subplot = fig.add_subplot(1, n, i + 2)
-                subplot.plot(sol.t, sol.y[i + 1, :], label=label)
-                subplot.legend()
-                subplot.set_xlabel('time [h]')
-                subplot.set_title('Peripheral compartment #' + str(i + 1))
-            else:
-                model.plot(sol.t, sol.y[i + 1, :], label=label)
-
-        # plot subcutanous injections compartment
-        if self.protocol.subcutaneous and not separate:
-            model.plot(sol.t, sol.y[-1, :], label='- q_0')
-
-        plt.legend()
-        fig.tight_layout()
-        return fig
+        from . import plotting
+        return plotting.plot(self, separate=separate)
 
     def compare_plots(self, solution_2):
         """
@@ -193,35 +533,8 @@ class Solution:
 
         :returns: Matplotlib Figure object
         """
-        sol1 = self.solver()
-        sol2 = solution_2.solver()
-        n = max(self.model.size, solution_2.model.size)
-        fig = plt.figure(figsize=(2 * 4.0, 3.0))
-        model1 = fig.add_subplot(1, 2, 1)
-        model1.set_title('Model 1')
-        model1.set_xlabel('time [h]')
-        model1.set_ylabel('drug mass [ng]')
-        model2 = fig.add_subplot(1, 2, 2)
-        model2.set_title('Model 2')
-        model2.set_xlabel('time [h]')
-        for i in range(n):
-            if i == 0:
-                label = '- q_c'
-            else:
-                label = '- q_p' + str(i + 1)
-            if i < len(sol1.y):
-                model1.plot(sol1.t, sol1.y[i, :], label=label)
-            if i < len(sol2.y):
-                model2.plot(sol2.t, sol2.y[i, :], label=label)
-        # plot subcutanous injections compartment
-        if self.protocol.subcutaneous:
-            model1.plot(sol1.t, sol1.y[-1, :], label='- q_0')
-        if solution_2.protocol.subcutaneous:
-            model2.plot(sol2.t, sol2.y[-1, :], label='- q_0')
-        model1.legend()
-        model2.legend()
-        fig.tight_layout()
-        return fig
+        from . import plotting
+        return plotting.compare_plots(self, solution_2)
 
     def compare_separate(self, solution_2):
         """
@@ -232,28 +545,8 @@ class Solution:
 
         :returns: Matplotlib Figure object
         """
-        sol1 = self.solver()
-        sol2 = solution_2.solver()
-        n = max(self.model.size, solution_2.model.size)
-        fig = plt.figure(figsize=(n * 4.0, 3.0))
-        central = fig.add_subplot(1, n, 1)
-        central.plot(sol1.t, sol1.y[0, :], label='model 1')
-        central.plot(sol2.t, sol2.y[0, :], label='model 2')
-        central.legend()
-        central.set_xlabel('time [h]')
-        central.set_ylabel('drug mass [ng]')
-        central.set_title('Central compartment')
-        for i in range(n - 1):
-            compartment = fig.add_subplot(1, n, i + 2)
-            if i + 1 < len(sol1.y):
-                compartment.plot(sol1.t, sol1.y[i + 1, :], label='model 1')
-            if i + 1 < len(sol2.y):
-                compartment.plot(sol2.t, sol2.y[i + 1, :], label='model 2')
-            compartment.legend()
-            compartment.set_xlabel('time [h]')
-            compartment.set_title('Peripheral compartment #' + str(i + 1))
-        fig.tight_layout()
-        return fig
+        from . import plotting
+        return plotting.compare_separate(self, solution_2)
 
     def generate_plot(self, compare=None,
                       separate=False, show=False, savefig=False):
@@ -269,22 +562,85 @@ class Solution:
         :param separate: If False (default), will show all compartments on the
         same plot. Set to True if you want 1 plot per compartment.
         """
-        fig = None
-        if compare is None:
-            fig = self.plot(separate=separate)
-        else:
-            assert type(compare) is Solution, 'compare should be a Solution'
-            if not separate:
-                fig = self.compare_plots(compare)
-            elif separate:
-                fig = self.compare_separate(compare)
+        from . import plotting
+        return plotting.generate_plot(self, compare=compare,
+                                      separate=separate, show=show,
+                                      savefig=savefig)
 
-        if show:
-            plt.show()
 
-        if type(savefig) is str:
-            fig.savefig(savefig + '.pdf')
-        elif savefig:
-            fig.savefig('pkplot.pdf')
+class Trajectory:
+    """Piecewise dense output of a solution
+
+    Evaluates the continuous solution of each integrated segment between
+    dosing events, taking the value right after the event at the event
+    times themselves.
+
+    Parameters
+    ----------
+
+    times: array of floats
+        sorted start times of the segments
+    segments: list of callables
+        dense output (e.g. scipy OdeSolution) of each segment, mapping an
+        array of times to an array of shape (size, len(times))
+    size: int
+        number of states
 
-        return fig
+    """
+    def __init__(self, times, segments, size):
+        self.times = np.asarray(times, dtype=float)
+        self.segments = segments
+        self.size = size
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=float)
+        k = np.clip(np.searchsorted(self.times, t, side='right') - 1,
+                    0, len(self.times) - 1)
+        y = np.empty((self.size, len(t)))
+        for segment in np.unique(k):
+            inside = k == segment
+            y[:, inside] = self.segments[segment](t[inside])
+        return y
+
+
+def _stream_block(stepper, schedule, t, carry):
+    """
+    Advances Solution.stream() over a block of output times t, applying
+    the dosing events of the schedule on the way. Returns the outputs at t
+    and the carry (time, rate, next event, state) at the end of the block.
+    """
+    b, n, advance, output = stepper
+    times, boluses, rates = schedule
+    now, rate, k, state = carry
+    y = np.empty((n, len(t)))
+    end = t[-1]
+    while True:
+        # doses are right-continuous: apply every event up to now
+        while k < len(times) and times[k] <= now:
+            state = state + b * boluses[k]
+            rate = rates[k]
+            k += 1
+        t1 = min(times[k] if k < len(times) else np.inf, end)
+        if t1 <= now:
+            break
+        inside = (t >= now) & (t < t1)
+        y[:, inside], state = advance(state, now, t1, rate, t[inside])
+        now = t1
+    y[:, t >= end] = output(state)[:, None]
+    return y, (now, rate, k, state)
+
+
+def _first_rows(trajectory, n, t):
+    """
+    Evaluates a trajectory and keeps the first n states.
+    """
+    return trajectory(t)[:n]
+
+
+def _sensitivity_rows(trajectory, n, t):
+    """
+    Evaluates a trajectory of the augmented state and returns the
+    sensitivities, of shape (parameters, n, len(t)).
+    """
+    y = trajectory(t)
+    return y[n:].reshape((len(y) - n) // n, n, len(t))
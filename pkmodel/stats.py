@@ -0,0 +1,113 @@
+#
+# Solve statistics
+#
+# Every solve of a Solution records a SolveStats, which is passed to the
+# hooks registered with add_hook() and to those of the Solution.
+#
+
+# Callbacks called with (solution, stats) after every solve
+_hooks = []
+
+
+class SolveStats:
+    """Statistics of one solve of a Solution
+
+    Attributes
+    ----------
+
+    engine, method: str
+        the engine and integration method of the Solution
+    cached: bool
+        True if the solution was taken from the cache, in which case no
+        integration took place and all counts are zero
+    setup, integration, output: float
+        wall time in seconds of each phase: compiling the model and the
+        dosing schedule, integrating (or propagating) between dosing
+        events, and evaluating the solution on t_eval
+    segments: int
+        number of intervals between dosing events that were integrated
+    rhs_calls: int
+        number of evaluations of the right hand side
+    dose_calls: int
+        number of calls to the dosing functions of the Protocol (the
+        schedule is computed once per solve)
+    steps: int
+        number of accepted integration steps
+    rejected_steps: int or None
+        number of rejected integration steps, for the explicit Runge-Kutta
+        methods (RK23, RK45, DOP853). None for the other methods, which do
+        not report them.
+    jacobian_calls, lu_decompositions: int
+        number of Jacobian evaluations and LU decompositions of the
+        implicit methods
+
+    """
+    __slots__ = ('engine', 'method', 'cached', 'setup', 'integration',
+                 'output', 'segments', 'rhs_calls', 'dose_calls', 'steps',
+                 'rejected_steps', 'jacobian_calls', 'lu_decompositions')
+
+    def __init__(self, engine, method, cached=False):
+        self.engine = engine
+        self.method = method
+        self.cached = cached
+        self.setup = self.integration = self.output = 0.
+        self.segments = self.rhs_calls = self.dose_calls = self.steps = 0
+        self.rejected_steps = None
+        self.jacobian_calls = self.lu_decompositions = 0
+
+    @property
+    def total(self):
+        """
+        Wall time of the whole solve, in seconds.
+        """
+        return self.setup + self.integration + self.output
+
+    def as_dict(self):
+        """
+        Returns the statistics as a dictionary, including the total time.
+        """
+        stats = {name: getattr(self, name) for name in self.__slots__}
+        stats['total'] = self.total
+        return stats
+
+    def __repr__(self):
+        return 'SolveStats(' + ', '.join(
+            name + '=' + repr(value)
+            for name, value in self.as_dict().items()) + ')'
+
+
+def add_hook(callback):
+    """
+    Registers a callback, called as callback(solution, stats) after every
+    solve of every Solution, e.g. to log slow solves.
+    """
+    _hooks.append(callback)
+
+
+def remove_hook(callback):
+    """
+    Unregisters a callback registered with add_hook().
+    """
+    _hooks.remove(callback)
+
+
+def notify(solution, stats):
+    """
+    Calls the registered hooks and then those of the solution.
+    """
+    for hook in list(_hooks) + list(solution.hooks):
+        hook(solution, stats)
+
+
+def rejected_steps(method, rhs_calls, steps):
+    """
+    Number of rejected steps of an explicit Runge-Kutta method of
+    scipy.integrate, from its right hand side calls: two to start, then
+    n_stages per attempted step (plus three per accepted step for the dense
+    output of DOP853). None for other methods.
+    """
+    stages = {'RK23': 3, 'RK45': 6, 'DOP853': 12}
+    if method not in stages:
+        return None
+    extra = 3 * steps if method == 'DOP853' else 0
+    return int(round((rhs_calls - 2 - extra) / stages[method])) - steps
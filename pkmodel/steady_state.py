@@ -0,0 +1,85 @@
+#
+# SteadyState class
+#
+import numpy as np
+
+from .propagator import propagator
+
+
+class SteadyState:
+    """The steady state of a Pharmokinetic (PK) model under periodic dosing
+
+    Because the model is linear, the state right after each dose converges
+    to the fixed point of the propagator over one dosing interval, which is
+    computed directly in modal coordinates instead of simulating the run-in
+    of many dosing cycles.
+
+    The periodic part of the protocol is its regimen (see
+    Protocol.add_regimen), continued indefinitely. Other instantaneous doses
+    and a finite continuous infusion only have a transient effect and do
+    not change the steady state.
+
+    Parameters
+    ----------
+
+    model: Model
+        the PK model, which should have a positive clearance
+
+    protocol: Protocol
+        dosing protocol with exactly one regimen
+
+    nsteps: int
+        number of time points over one dosing interval
+        default value is 100
+
+    Attributes
+    ----------
+
+    t: numpy array
+        time since the last dose, from 0 to the dosing interval
+    y: numpy array, shape (compartments, nsteps)
+        drug quantity in each compartment over one interval at steady state
+    concentration: numpy array, shape (model.size, nsteps)
+        y divided by the compartment volumes (without the depot)
+    peak, trough, average: numpy arrays, shape (model.size,)
+        steady state maximum, pre-dose and time averaged concentrations
+    time_of_peak: numpy array, shape (model.size,)
+        time after the dose at which the peak is reached
+    accumulation_ratio: numpy array, shape (model.size,)
+        area under the curve over one interval at steady state, divided
+        by that over the first interval after the first dose
+
+    """
+    def __init__(self, model, protocol, nsteps=100):
+        if len(protocol.regimens) != 1 or not protocol.instantaneous:
+            raise ValueError('The protocol should have exactly one regimen')
+        _, interval, _, amount = protocol.regimens[0]
+        k_a = protocol.k_a if protocol.subcutaneous else None
+        exact = propagator(model, k_a)
+        if np.any(exact.eigenvalues >= 0):
+            raise ValueError('There is no steady state without clearance')
+
+        first = exact.b_modal * amount
+        # fixed point of z -> M z + first, right after a dose, where the
+        # rows of propagate(I) are the columns of the interval propagator M
+        M = exact.propagate(np.eye(exact.size), interval).T
+        z_ss = np.linalg.solve(np.eye(exact.size) - M, first)
+
+        self.interval = interval
+        self.t = np.linspace(0, interval, nsteps)
+        self.y = exact.W @ exact.propagate(z_ss, self.t[:, None]).T
+
+        volumes = np.concatenate(([model.Vc], model.Vps))[:, None]
+        n = len(volumes)
+        self.concentration = self.y[:n] / volumes
+        peak = np.argmax(self.concentration, axis=1)
+        self.peak = self.concentration[np.arange(n), peak]
+        self.time_of_peak = self.t[peak]
+        self.trough = (exact.W @ (M @ z_ss))[:n] / volumes[:, 0]
+        average = exact.W @ exact.integrate(z_ss, interval) / interval
+        self.average = average[:n] / volumes[:, 0]
+
+        first_average = (exact.W @ exact.integrate(first, interval))[:n] \
+            / interval
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.accumulation_ratio = average[:n] / first_average
@@ -0,0 +1,141 @@
+#
+# Superposition class
+#
+import numpy as np
+
+from .propagator import phi, propagator
+
+
+class Superposition:
+    """Impulse response superposition for many protocols on one model
+
+    The model is linear, so the response to any dosing protocol is a sum of
+    shifted impulse responses (for instantaneous doses) and step responses
+    (for the start and end of continuous dosing). This class computes these
+    responses once on a uniform grid, and obtains the trajectory of each
+    protocol by FFT convolution of its doses with them. The convolution is
+    done in the modal coordinates of the model, where doses between grid
+    points can be shifted exactly, so the result is exact on the grid.
+
+    Parameters
+    ----------
+
+    model: Model
+        the PK model shared by all protocols
+
+    tmax: float
+        end of the uniform time grid
+        default value is 1
+
+    nsteps: int
+        number of time points of the grid
+        default value is 1000
+
+    subcutaneous: bool
+        dosing route of the protocols, default False
+
+    k_a: float
+        absorption rate of subcutaneous dosing, default 1
+
+    Attributes
+    ----------
+
+    t_eval: numpy array
+        the uniform time grid
+    impulse_response: numpy array, shape (compartments, nsteps)
+        drug quantity after a unit instantaneous dose at time 0
+    step_response: numpy array, shape (compartments, nsteps)
+        drug quantity under unit rate continuous dosing from time 0
+
+    """
+    def __init__(self, model, tmax=1, nsteps=1000, subcutaneous=False,
+                 k_a=1):
+        import scipy.fft
+        self.subcutaneous = bool(subcutaneous)
+        self.k_a = k_a if self.subcutaneous else None
+        self.exact = propagator(model, self.k_a)
+        self.t_eval = np.linspace(0, tmax, nsteps)
+        self.tmax = tmax
+        self.nsteps = nsteps
+        self.dt = self.t_eval[1] - self.t_eval[0] if nsteps > 1 else 1.
+
+        exact = self.exact
+        t = self.t_eval[:, None]
+        self.impulse_response = exact.W @ exact.propagate(exact.b_modal, t).T
+        self.step_response = exact.W @ exact.integrate(exact.b_modal, t).T
+
+        # transforms of the modal kernels, reused by every protocol: the
+        # propagation of each mode on its own and, with a depot, that of a
+        # unit depot amount into the other modes
+        self._length = scipy.fft.next_fast_len(2 * nsteps)
+        x = np.outer(exact.eigenvalues, self.t_eval)
+        depot = np.zeros(exact.size)
+        depot[-1] = 1.
+        kernels = [np.exp(x), self.t_eval * phi(x)]
+        if exact.gain is not None:
+            kernels += [exact.propagate(depot, t).T,
+                        exact.integrate(depot, t).T]
+            kernels[2][-1] = kernels[3][-1] = 0.
+        self._kernels = [scipy.fft.rfft(kernel, self._length)
+                         for kernel in kernels]
+
+    def solve(self, protocol):
+        """
+        Returns the drug quantity in each compartment on t_eval for a
+        protocol, as an array of shape (compartments, nsteps).
+        """
+        return self.solve_many([protocol])[0]
+
+    def solve_many(self, protocols):
+        """
+        Returns the drug quantity in each compartment on t_eval for each
+        protocol, as an array of shape (protocols, compartments, nsteps).
+        All protocols are convolved in one batched FFT.
+        """
+        import scipy.fft
+        impulses, steps, heavisides = [], [], []
+        for protocol in protocols:
+            if bool(protocol.subcutaneous) != self.subcutaneous or (
+                    self.subcutaneous and protocol.k_a != self.k_a):
+                raise ValueError('The protocol dosing route and k_a should '
+                                 'match those of the Superposition')
+            impulse, step, heaviside = self._inputs(protocol)
+            impulses.append(impulse)
+            steps.append(step)
+            heavisides.append(heaviside)
+
+        impulses = scipy.fft.rfft(np.array(impulses), self._length)
+        steps = scipy.fft.rfft(np.array(steps), self._length)
+        transform = impulses * self._kernels[0] + steps * self._kernels[1]
+        if self.exact.gain is not None:
+            # the depot empties into the other modes
+            transform += impulses[:, -1:] * self._kernels[2] \
+                + steps[:, -1:] * self._kernels[3]
+        z = scipy.fft.irfft(transform, self._length)[..., :self.nsteps]
+        z += np.cumsum(np.array(heavisides), axis=-1)
+        return np.einsum('ij,pjt->pit', self.exact.W, z)
+
+    def _inputs(self, protocol):
+        """
+        Places the dosing events of a protocol on the grid, in modal
+        coordinates. An event at time a acts from the first grid point
+        t_j >= a, shifted by delta = t_j - a: a dose is propagated over
+        delta, and a rate change adds the dose integrated over delta.
+        """
+        times, boluses, rates = protocol.schedule(self.tmax)
+        rate_changes = np.diff(rates, prepend=0.)
+        j = np.minimum(np.ceil(times / self.dt - 1e-9).astype(int),
+                       self.nsteps - 1)
+        delta = (self.t_eval[j] - times)[:, None]
+        shift = self.exact.propagate(self.exact.b_modal, delta).T
+        partial = self.exact.integrate(self.exact.b_modal, delta).T
+
+        shape = (self.exact.size, self.nsteps)
+        impulse, step, heaviside = (np.zeros(shape), np.zeros(shape),
+                                    np.zeros(shape))
+        for target, weights in [(impulse, shift * boluses),
+                                (step, shift * rate_changes),
+                                (heaviside, partial * rate_changes)]:
+            for mode in range(shape[0]):
+                np.add.at(target[mode], j, weights[mode])
+        return impulse, step, heaviside
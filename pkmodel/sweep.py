@@ -0,0 +1,133 @@
+#
+# Sweep class
+#
+import math
+import os
+
+import numpy as np
+
+from .solution import Solution
+
+
+class Sweep:
+    """A parallel parameter sweep over Pharmokinetic (PK) scenarios
+
+    Distributes (model, protocol) scenarios over a pool of worker
+    processes. The workers are started once and reused by every call to
+    run(), and write the trajectories straight into an array shared through
+    a memory mapped temporary file, instead of sending solution objects
+    back to the parent process.
+
+    Use as a context manager, or call close(), to shut the pool down.
+
+    Parameters
+    ----------
+
+    processes: int, optional
+        number of worker processes, default os.cpu_count(). With
+        processes=1 scenarios are solved in the calling process.
+
+    chunksize: int, optional
+        number of scenarios sent to a worker at once. By default each worker
+        receives about four chunks per run.
+
+    tmax, nsteps, method, engine, rtol, atol:
+        passed on to every Solution. The solutions are not kept in the
+        solution cache, as the scenarios of a sweep are all different.
+
+    """
+    def __init__(self, processes=None, chunksize=None, tmax=1, nsteps=1000,
+                 method='RK45', engine='ode', rtol=1e-3, atol=1e-6):
+        self.processes = processes or os.cpu_count()
+        self.chunksize = chunksize
+        self.options = {'tmax': tmax, 'nsteps': nsteps, 'method': method,
+                        'engine': engine, 'rtol': rtol, 'atol': atol,
+                        'cache': False}
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down the worker processes.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def run(self, scenarios):
+        """
+        Solves every scenario.
+
+        Paramater: scenarios: list of (Model, Protocol) pairs.
+
+        Returns: numpy array of shape (scenarios, compartments, nsteps) with
+        the drug quantity in each compartment, as in Solution.sol.y. Models
+        with fewer compartments than the largest one are padded with NaN.
+        """
+        scenarios = list(scenarios)
+        rows = [model.size + bool(protocol.subcutaneous)
+                for model, protocol in scenarios]
+        shape = (len(scenarios), max(rows, default=0),
+                 self.options['nsteps'])
+        if self.processes == 1 or not scenarios:
+            result = np.full(shape, np.nan)
+            _solve_chunk(result, 0, scenarios, self.options)
+            return result
+
+        # multiprocessing is only imported for parallel runs
+        import multiprocessing
+        import tempfile
+        if self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes,
+                                             initializer=_warm_up)
+        chunksize = self.chunksize or max(
+            1, math.ceil(len(scenarios) / (4 * self.processes)))
+        # the file is only a backing store: the workers and the parent map
+        # the same pages, which the operating system keeps in memory
+        handle, path = tempfile.mkstemp(prefix='pkmodel-', suffix='.dat')
+        os.close(handle)
+        try:
+            shared = np.memmap(path, dtype=float, mode='w+', shape=shape)
+            shared[:] = np.nan
+            shared.flush()
+            tasks = [(path, shape, start, scenarios[start:start + chunksize],
+                      self.options)
+                     for start in range(0, len(scenarios), chunksize)]
+            self.pool.starmap(_solve_mapped_chunk, tasks, chunksize=1)
+            result = np.array(shared)
+            del shared
+        finally:
+            os.remove(path)
+        return result
+
+
+def _warm_up():
+    """
+    Worker initializer: imports the numerical libraries once per process.
+    """
+    import scipy.integrate  # noqa
+
+
+def _solve_chunk(result, start, scenarios, options):
+    """
+    Solves a chunk of scenarios into result[start:start + len(scenarios)].
+    """
+    for i, (model, protocol) in enumerate(scenarios):
+        y = Solution(model, protocol, **options).sol.y
+        result[start + i, :len(y)] = y
+
+
+def _solve_mapped_chunk(path, shape, start, scenarios, options):
+    """
+    Solves a chunk of scenarios into the array memory mapped from path.
+    """
+    result = np.memmap(path, dtype=float, mode='r+', shape=shape)
+    _solve_chunk(result, start, scenarios, options)
+    result.flush()
+    del result
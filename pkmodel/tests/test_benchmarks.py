@@ -0,0 +1,61 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from pkmodel import benchmarks
+
+
+class BenchmarksTest(unittest.TestCase):
+    """
+    Tests the :mod:`benchmarks` module.
+    """
+    def test_import_time(self):
+        """
+        Tests importing pkmodel does not import matplotlib or scipy.
+        """
+        result = benchmarks.import_time(repeat=1)
+        self.assertEqual(result['modules'], [])
+        self.assertGreater(result['seconds'], 0)
+
+    def test_run(self):
+        """
+        Tests benchmarks run and are written as JSON.
+        """
+        self.assertIn(benchmarks.BASE_CASE, benchmarks.cases())
+        self.assertEqual(len(benchmarks.cases(full=True)), 72)
+        small = dict(benchmarks.BASE_CASE, nsteps=11, route='sc')
+        report = benchmarks.run(grid=[small], repeat=1, imports=False)
+        self.assertEqual(set(r['benchmark'] for r in
+                             report['results'].values()),
+                         set(benchmarks.BENCHMARKS))
+        for result in report['results'].values():
+            self.assertGreater(result['seconds'], 0)
+        json.dumps(report)
+
+    def test_compare(self):
+        """
+        Tests regressions against a baseline are flagged.
+        """
+        def report(seconds):
+            return {'results': {name: {'seconds': s}
+                                for name, s in seconds.items()}}
+        baseline = report({'a': 1., 'b': 1., 'c': 1., 'd': 1.})
+        current = report({'a': 1.05, 'b': 1.5, 'c': 0.5, 'e': 1.})
+        rows = benchmarks.compare(baseline, current)
+        self.assertEqual([(row[0], row[4]) for row in rows],
+                         [('a', 'ok'), ('b', 'regression'),
+                          ('c', 'improvement')])
+
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name + '.json')
+                     for name in ['baseline', 'current']]
+            for path, data in zip(paths, [baseline, current]):
+                with open(path, 'w') as f:
+                    json.dump(data, f)
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                self.assertEqual(benchmarks.main(['compare'] + paths), 1)
+                self.assertEqual(benchmarks.main(
+                    ['compare', paths[0], paths[0]]), 0)
+            self.assertIn('1 regressions', output.getvalue())
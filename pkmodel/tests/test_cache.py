@@ -0,0 +1,117 @@
+import unittest
+import pkmodel as pk
+import numpy as np
+from pkmodel.cache import SolutionCache, solution_cache
+
+
+class CacheTest(unittest.TestCase):
+    """
+    Tests the :class:`SolutionCache` class and snapshots.
+    """
+    def test_snapshots(self):
+        """
+        Tests equal parameters give equal, hashable snapshots.
+        """
+        model = pk.Model(Vc=2, Vps=[1], Qps=[3], CL=1)
+        same = pk.Model(Vc=2., Vps=[1.], Qps=[3.], CL=1.)
+        self.assertEqual(hash(model.snapshot()), hash(same.snapshot()))
+        same.add_compartment()
+        self.assertNotEqual(model.snapshot(), same.snapshot())
+
+        dosing = pk.Protocol(k_a=0.5, dose_times=[2, 1],
+                             instant_doses=[1, 3])
+        same = pk.Protocol(k_a=2, dose_times=[1., 2.],
+                           instant_doses=[3., 1.])
+        self.assertEqual(hash(dosing.snapshot()), hash(same.snapshot()))
+        same.modify_dose_type(True, 2)
+        self.assertNotEqual(dosing.snapshot(), same.snapshot())
+
+    def test_snapshot_reuse(self):
+        """
+        Tests snapshots are kept until the model or protocol changes.
+        """
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        first = model.snapshot()
+        self.assertIs(model.snapshot(), first)
+        model.add_compartment(1., 3.)
+        self.assertEqual(model.snapshot()[2:], ((1.,), (3.,)))
+
+        dosing = pk.Protocol(continuous=True, dose_times=[1.],
+                             instant_doses=[2.])
+        first = dosing.snapshot()
+        dosing.sorted_doses()
+        self.assertIs(dosing.snapshot(), first)
+        dosing.continuous_period[1] = 4.
+        self.assertEqual(dosing.snapshot()[2], (1., (0., 4.)))
+        dosing.dose_amount = 3.
+        self.assertEqual(dosing.snapshot()[2], (3., (0., 4.)))
+        dosing.instant_doses[0] = 5.
+        self.assertEqual(dosing.snapshot()[3], ((1., 5.),))
+        dosing.make_continuous(1., 2.)
+        self.assertEqual(dosing.snapshot()[2], (3., (1., 2.)))
+
+    def test_lru(self):
+        """
+        Tests hits, misses and eviction under the memory budget.
+        """
+        cache = SolutionCache(max_bytes=2000)
+        cache.put('a', np.zeros(100))
+        cache.put('b', (np.zeros(100), {'y': np.zeros(10)}))
+        self.assertEqual(cache.nbytes, 1680)
+        self.assertIsNotNone(cache.get('a'))
+        cache.put('c', np.zeros(100))
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        cache.put('d', np.zeros(1000))
+        self.assertNotIn('d', cache)
+        self.assertEqual(cache.stats(), {
+            'hits': 1, 'misses': 1, 'evictions': 1, 'entries': 2,
+            'nbytes': 1600, 'max_bytes': 2000})
+        cache.resize(1000)
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertEqual(cache.nbytes, 0)
+
+    def test_solution_cache(self):
+        """
+        Tests identical solutions are solved once and share the result.
+        """
+        solution_cache.clear()
+        model = pk.Model(Vc=2., Vps=[1.], Qps=[3.], CL=1.)
+        for engine in ['ode', 'exact']:
+            first = pk.Solution(model, pk.Protocol(dose_times=[0, 1],
+                                                   instant_doses=[1, 1]),
+                                tmax=3, engine=engine, cache=True)
+            second = pk.Solution(pk.Model(Vc=2., Vps=[1.], Qps=[3.], CL=1.),
+                                 pk.Protocol(dose_times=[1, 0],
+                                             instant_doses=[1, 1]),
+                                 tmax=3, engine=engine, cache=True)
+            self.assertIs(first.sol, second.sol)
+            self.assertFalse(second.sol.y.flags.writeable)
+            # without the cache, results are private and writable
+            own = pk.Solution(model, pk.Protocol(dose_times=[0, 1],
+                                                 instant_doses=[1, 1]),
+                              tmax=3, engine=engine)
+            self.assertIsNot(own.sol, first.sol)
+            own.sol.y[0, 0] = 3.
+        self.assertEqual(solution_cache.hits, 2)
+        self.assertEqual(solution_cache.misses, 2)
+        self.assertGreater(solution_cache.nbytes, 2 * 3 * 1000 * 8)
+
+    def test_in_place_changes(self):
+        """
+        Tests a solution is recomputed after a dose is appended in place.
+        """
+        solution_cache.clear()
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        protocol = pk.Protocol(dose_times=[0], instant_doses=[1])
+        solution = pk.Solution(model, protocol, tmax=3, nsteps=4,
+                               engine='exact')
+        solution.sol
+        protocol.dose_times.append(1.)
+        protocol.instant_doses.append(2.)
+        expected = pk.Solution(model, pk.Protocol(dose_times=[0, 1],
+                                                  instant_doses=[1, 2]),
+                               tmax=3, nsteps=4, engine='exact', cache=False)
+        np.testing.assert_allclose(solution.sol.y, expected.sol.y)
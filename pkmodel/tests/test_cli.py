@@ -0,0 +1,120 @@
+import contextlib
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import cli
+
+
+class CliTest(unittest.TestCase):
+    """
+    Tests the :mod:`cli` module.
+    """
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = self.directory.name
+        self.scenarios = [
+            {'name': 'iv', 'Vc': 2., 'CL': 1., 'Vps': [4.], 'Qps': [1.],
+             'dose_times': [0, 0.5], 'instant_doses': [1., 2.], 'tmax': 2,
+             'nsteps': 21},
+            {'Vc': 1., 'CL': 1., 'subcutaneous': True, 'k_a': 3.,
+             'regimens': [[0, 1, 2, 1.]], 'tmax': 2, 'nsteps': 21,
+             'engine': 'exact'},
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_cli(self, *args):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return cli.main(list(args))
+
+    def read_metrics(self, output):
+        with open(os.path.join(output, 'metrics.csv')) as f:
+            return list(csv.DictReader(f))
+
+    def test_json(self):
+        """
+        Tests solving the scenarios of a JSON file, serially and in
+        parallel.
+        """
+        scenarios = os.path.join(self.path, 'scenarios.json')
+        with open(scenarios, 'w') as f:
+            json.dump(self.scenarios, f)
+        for processes in ['1', '2']:
+            output = os.path.join(self.path, 'out' + processes)
+            self.assertEqual(self.run_cli(scenarios, '-o', output, '-p',
+                                          processes, '--threshold', '0.1'),
+                             0)
+            rows = self.read_metrics(output)
+            self.assertEqual([(r['scenario'], r['compartment'])
+                              for r in rows],
+                             [('iv', '0'), ('iv', '1'),
+                              ('scenario-2', '0')])
+            self.assertTrue(all(r['status'] == 'ok' for r in rows))
+
+            trajectory = np.loadtxt(os.path.join(output, 'iv.csv'),
+                                    delimiter=',', skiprows=1)
+            solution = pk.Solution(
+                pk.Model(2., [4.], [1.], 1.),
+                pk.Protocol(dose_times=[0, 0.5], instant_doses=[1., 2.]),
+                tmax=2, nsteps=21)
+            np.testing.assert_allclose(trajectory[:, 1:].T, solution.sol.y)
+            self.assertAlmostEqual(float(rows[0]['cmax']),
+                                   solution.sol.y[0].max() / 2.)
+            with open(os.path.join(output, 'scenario-2.csv')) as f:
+                self.assertEqual(f.readline().strip(), 't,q_c,q_0')
+
+    def test_csv(self):
+        """
+        Tests solving the scenarios of a CSV file, with npz outputs and a
+        failing scenario.
+        """
+        scenarios = os.path.join(self.path, 'scenarios.csv')
+        with open(scenarios, 'w') as f:
+            f.write('name,Vc,CL,Vps,Qps,subcutaneous,regimens,tmax,nsteps\n'
+                    'a,2,1,4;1,1;2,no,0 0.5 3 1,2,11\n'
+                    'b,1,1,,,yes,,2,11\n'
+                    'c,1,1,,,no,,2,-1\n')
+        self.assertEqual(cli.load_scenarios(scenarios)[0]['regimens'],
+                         [(0., 0.5, 3, 1.)])
+        output = os.path.join(self.path, 'out')
+        self.assertEqual(self.run_cli(scenarios, '-o', output, '-f', 'npz',
+                                      '--float32'), 1)
+        rows = self.read_metrics(output)
+        self.assertEqual([r['scenario'] for r in rows], ['a', 'a', 'a', 'b',
+                                                         'c'])
+        self.assertTrue(rows[-1]['status'].startswith('error'))
+        result = pk.Result.load(os.path.join(output, 'a.npz'))
+        self.assertEqual(result.y.shape, (3, 11))
+        self.assertEqual(result.y.dtype, np.float32)
+
+    def test_invalid(self):
+        """
+        Tests invalid scenario files are rejected.
+        """
+        scenarios = os.path.join(self.path, 'scenarios.json')
+        with open(scenarios, 'w') as f:
+            json.dump({'scenarios': [{'Vc': 1., 'CL': 1., 'Vq': 1.}]}, f)
+        with contextlib.redirect_stderr(io.StringIO()):
+            with self.assertRaises(SystemExit):
+                self.run_cli(scenarios)
+
+        base = {'Vc': 1., 'CL': 1.}
+        for invalid in [[dict(base, name='../escape')],
+                        [dict(base, name='a'), dict(base, name='a')],
+                        [dict(base, name='scenario-2'), base]]:
+            with open(scenarios, 'w') as f:
+                json.dump(invalid, f)
+            with self.assertRaises(ValueError):
+                cli.load_scenarios(scenarios)
+            with contextlib.redirect_stderr(io.StringIO()):
+                with self.assertRaises(SystemExit):
+                    self.run_cli(scenarios, '-o', os.path.join(self.path,
+                                                               'out'))
+        self.assertFalse(os.path.exists(os.path.join(self.path,
+                                                     'escape.csv')))
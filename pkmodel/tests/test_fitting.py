@@ -0,0 +1,102 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class FitTest(unittest.TestCase):
+    """
+    Tests the :class:`Fit` class.
+    """
+    def setUp(self):
+        self.truth = pk.Model(Vc=2., Vps=[4.], Qps=[1.5], CL=1.)
+        self.dosing = pk.Protocol(dose_times=[0, 2], instant_doses=[1., 1.],
+                                  subcutaneous=True, k_a=3.)
+        self.times = np.linspace(0.1, 6, 30)
+        solution = pk.Solution(self.truth, self.dosing, tmax=6,
+                               engine='exact')
+        self.central = solution.concentration(self.times)[0]
+        self.peripheral = solution.concentration(self.times)[1]
+
+    def test_gradients(self):
+        """
+        Tests the analytic gradients against finite differences.
+        """
+        guess = pk.Model(Vc=1.5, Vps=[3.], Qps=[1.], CL=1.2)
+        fit = pk.Fit(guess, self.dosing, self.times, self.central,
+                     loss='likelihood', error_model='combined')
+        x = np.log([1.5, 1.2, 3., 1., 2., 0.05, 0.1])
+        value, gradient = fit.negative_log_likelihood(x)
+        h = 1e-6
+        for j in range(len(x)):
+            dx = np.zeros(len(x))
+            dx[j] = h
+            numerical = (fit.negative_log_likelihood(x + dx)[0]
+                         - fit.negative_log_likelihood(x - dx)[0]) / (2 * h)
+            self.assertAlmostEqual(gradient[j], numerical,
+                                   delta=1e-6 * max(1, abs(numerical)))
+
+        J = fit.jacobian(x[:5])
+        for j in range(5):
+            dx = np.zeros(5)
+            dx[j] = h
+            numerical = (fit.residuals(x[:5] + dx)
+                         - fit.residuals(x[:5] - dx)) / (2 * h)
+            np.testing.assert_allclose(J[:, j], numerical, atol=1e-6)
+
+    def test_least_squares(self):
+        """
+        Tests least squares recovers the parameters of noiseless data,
+        observed in two compartments.
+        """
+        guess = pk.Model(Vc=1.5, Vps=[3.], Qps=[1.], CL=1.5)
+        times = np.concatenate((self.times, self.times))
+        observed = np.concatenate((self.central, self.peripheral))
+        compartment = [0] * 30 + [1] * 30
+        result = pk.Fit(guess, self.dosing, times, observed,
+                        compartment=compartment).run()
+        self.assertTrue(result.success)
+        self.assertEqual(result.parameter_names,
+                         ['Vc', 'CL', 'Vp1', 'Qp1', 'k_a'])
+        np.testing.assert_allclose(result.x, [2., 1., 4., 1.5, 3.],
+                                   rtol=1e-6)
+        self.assertEqual(result.model.snapshot()[:2], (result.x[0],
+                                                       result.x[1]))
+        self.assertEqual(result.covariance.shape, (5, 5))
+        self.assertLess(result.cost, 1e-8)
+        # the initial protocol is not modified
+        self.assertEqual(self.dosing.k_a, 3.)
+
+        # parameters can be kept fixed
+        result = pk.Fit(guess, self.dosing, self.times, self.central,
+                        parameters=['CL', 'k_a']).run()
+        self.assertEqual(result.estimates['Vc'], 1.5)
+        self.assertEqual(len(result.x), 2)
+
+    def test_likelihood(self):
+        """
+        Tests maximum likelihood on data with proportional noise.
+        """
+        rng = np.random.default_rng(1)
+        noisy = self.central * (1 + 0.05 * rng.standard_normal(30))
+        result = pk.Fit(self.truth, self.dosing, self.times, noisy,
+                        loss='likelihood', error_model='proportional').run()
+        self.assertEqual(result.parameter_names[-1], 'sigma_prop')
+        np.testing.assert_allclose(result.estimates['sigma_prop'], 0.05,
+                                   rtol=0.5)
+        low, high = result.confidence_intervals[:, 0], \
+            result.confidence_intervals[:, 1]
+        self.assertTrue(np.all(low < result.x) and np.all(result.x < high))
+        self.assertTrue(np.all(result.standard_errors > 0))
+
+    def test_invalid(self):
+        """
+        Tests invalid fits raise errors.
+        """
+        with self.assertRaises(ValueError):
+            pk.Fit(self.truth, self.dosing, [1.], [1.], loss='bayes')
+        with self.assertRaises(ValueError):
+            pk.Fit(self.truth, self.dosing, [1.], [1., 2.])
+        with self.assertRaises(ValueError):
+            pk.Fit(self.truth, self.dosing, [1.], [1.], compartment=2)
+        with self.assertRaises(ValueError):
+            pk.Fit(self.truth, self.dosing, [1.], [1.], parameters=['Q'])
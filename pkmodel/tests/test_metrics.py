@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import metrics
+
+
+class MetricsTest(unittest.TestCase):
+    """
+    Tests the :mod:`metrics` module.
+    """
+    def setUp(self):
+        # one compartment, intravenous bolus: c = exp(-t / 2) / 2
+        self.model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        dosing = pk.Protocol(dose_times=[0], instant_doses=[1.])
+        self.solution = pk.Solution(self.model, dosing, tmax=10, nsteps=201,
+                                    engine='exact')
+        self.t = self.solution.sol.t
+        self.c = metrics.concentration(self.model, self.solution.sol.y)
+
+    def test_metrics(self):
+        """
+        Tests the metrics against the analytic one compartment model.
+        """
+        t, c = self.t, self.c
+        exact = 1 - np.exp(-5)
+        np.testing.assert_allclose(metrics.auc(t, c, 'log'), [exact])
+        np.testing.assert_allclose(metrics.auc(t, c), [exact], rtol=1e-3)
+        np.testing.assert_allclose(metrics.auc_inf(t, c, 'log'), [1.])
+        np.testing.assert_allclose(metrics.half_life(t, c),
+                                   [2 * np.log(2)])
+        np.testing.assert_allclose(metrics.cmax(t, c), [0.5])
+        np.testing.assert_allclose(metrics.tmax(t, c), [0.])
+        np.testing.assert_allclose(metrics.cmin(t, c), [0.5 * np.exp(-5)])
+        np.testing.assert_allclose(metrics.time_above(t, c, 0.25),
+                                   [2 * np.log(2)], rtol=1e-4)
+        np.testing.assert_allclose(metrics.trough(t, c, [-1., 2.]),
+                                   [[np.nan, c[0, 39]]])
+        summary = metrics.summary(t, c, threshold=0.25, dose_times=[2.])
+        self.assertEqual(set(summary), {'auc', 'auc_inf', 'cmax', 'tmax',
+                                        'cmin', 'half_life', 'time_above',
+                                        'trough'})
+        # no terminal decay
+        self.assertTrue(np.isnan(metrics.half_life(t, np.ones(201))))
+        with self.assertRaises(ValueError):
+            metrics.auc(t, c, 'cubic')
+
+    def test_population(self):
+        """
+        Tests the metrics vectorise over a population.
+        """
+        population = pk.Population(Vc=[1., 2., 4.], CL=[1., 1., 2.],
+                                   Vps=[[1.]] * 3, Qps=[[2.]] * 3)
+        dosing = pk.Protocol(dose_times=[0, 2], instant_doses=[1., 1.],
+                             subcutaneous=True)
+        solution = pk.PopulationSolution(population, dosing, tmax=10,
+                                         nsteps=101)
+        c = metrics.concentration(population, solution.y)
+        self.assertEqual(c.shape, (3, 2, 101))
+        summary = metrics.summary(solution.t_eval, c, threshold=[[0.1], [0.2],
+                                                                 [0.3]])
+        for value in summary.values():
+            self.assertEqual(value.shape, (3, 2))
+        for i in range(3):
+            model = pk.Model(Vc=population.Vc[i], Vps=[1.], Qps=[2.],
+                             CL=population.CL[i])
+            single = pk.Solution(model, dosing, tmax=10, nsteps=101,
+                                 engine='exact')
+            np.testing.assert_allclose(
+                metrics.auc(single.sol.t, single.concentration(single.sol.t)),
+                summary['auc'][i])
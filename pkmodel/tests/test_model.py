@@ -1,5 +1,7 @@
 import unittest
+import numpy as np
 import pkmodel as pk
+from pkmodel.model import compartment_matrix, matrix_derivatives
 
 
 class ModelTest(unittest.TestCase):
@@ -36,6 +38,79 @@ class ModelTest(unittest.TestCase):
         self.assertIsInstance(model.Vc, float)
         self.assertIsInstance(model.CL, float)
 
+    def test_compartment_matrix(self):
+        """
+        Tests the compiled transfer matrix and input vector
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 2.], CL=3.)
+        A, b = compartment_matrix(model)
+        self.assertEqual(A.shape, (3, 3))
+        np.testing.assert_array_equal(b, [1, 0, 0])
+        self.assertAlmostEqual(A[0, 0], -(3. + 5.) / 2.)
+        self.assertAlmostEqual(A[1, 0], 3. / 2.)
+        self.assertAlmostEqual(A[0, 2], 2. / 4.)
+        # drug only leaves the system through clearance
+        np.testing.assert_allclose(A.sum(axis=0), [-3. / 2., 0, 0])
+
+        A, b = compartment_matrix(model, k_a=0.5)
+        self.assertEqual(A.shape, (4, 4))
+        np.testing.assert_array_equal(b, [0, 0, 0, 1])
+        self.assertEqual(A[0, -1], 0.5)
+        self.assertEqual(A[-1, -1], -0.5)
+
+    def test_compile(self):
+        """
+        Tests compile and freeze give a cached, immutable compiled model
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 2.], CL=3.)
+        self.assertFalse(hasattr(model, '__dict__'))
+        compiled = model.compile()
+        self.assertIs(model.compile(), compiled)
+        self.assertEqual(compiled.snapshot(), model.snapshot())
+        np.testing.assert_array_equal(compiled.matrix,
+                                      compartment_matrix(model)[0])
+        np.testing.assert_array_equal(compiled.Q_over_Vp, [3., 0.5])
+        self.assertEqual(compiled.Q_total, 5.)
+        for k_a in [None, 0.5]:
+            for expected, actual in zip(compartment_matrix(model, k_a),
+                                        compiled.system(k_a)):
+                np.testing.assert_array_equal(expected, actual)
+        with self.assertRaises(AttributeError):
+            compiled.CL = 1.
+        with self.assertRaises(ValueError):
+            compiled.matrix[0, 0] = 1.
 
+        model.add_compartment(1., 1.)
+        self.assertIsNot(model.compile(), compiled)
+        self.assertIs(model.freeze(), model.compile())
+        self.assertTrue(model.frozen)
+        with self.assertRaises(AttributeError):
+            model.add_compartment()
 
+        dosing = pk.Protocol(dose_times=[0, 0.5], instant_doses=[1., 1.])
+        np.testing.assert_allclose(
+            pk.Solution(compiled, dosing, cache=False).sol.y,
+            pk.Solution(pk.Model(2., [1., 4.], [3., 2.], 3.), dosing,
+                        cache=False).sol.y)
 
+    def test_matrix_derivatives(self):
+        """
+        Tests the derivatives of the transfer matrix against finite
+        differences.
+        """
+        params = {'Vc': 2., 'CL': 3., 'Vps': [1., 4.], 'Qps': [3., 2.]}
+        names, dA = matrix_derivatives(pk.Model(**params), k_a=0.5)
+        self.assertEqual(names, ['Vc', 'CL', 'Vp1', 'Qp1', 'Vp2', 'Qp2',
+                                 'k_a'])
+        h = 1e-6
+        for j, name in enumerate(names):
+            values = dict(params, Vps=list(params['Vps']),
+                          Qps=list(params['Qps']), k_a=0.5)
+            if name.startswith('Vp') or name.startswith('Qp'):
+                values[name[:2] + 's'][int(name[2:]) - 1] += h
+            else:
+                values[name] += h
+            k_a = values.pop('k_a')
+            A_h = compartment_matrix(pk.Model(**values), k_a)[0]
+            A = compartment_matrix(pk.Model(**params), 0.5)[0]
+            np.testing.assert_allclose(dA[j], (A_h - A) / h, atol=1e-5)
@@ -0,0 +1,86 @@
+import os
+import re
+import sys
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+from pkmodel import plotting
+
+
+class PlottingTest(unittest.TestCase):
+    """
+    Tests the :mod:`plotting` module.
+    """
+    def setUp(self):
+        model = pk.Model(Vc=2., Vps=[4.], Qps=[1.], CL=1.)
+        dosing = pk.Protocol(dose_times=[0, 0.5], instant_doses=[1., 2.])
+        self.solutions = [pk.Solution(model, dosing, nsteps=51,
+                                      engine='exact'),
+                          pk.Solution(pk.Model(1., [1., 2.], [1., 1.], 1.),
+                                      dosing, nsteps=51, engine='exact')]
+        population = pk.Population(Vc=np.linspace(1., 3., 7), CL=1.,
+                                   Vps=[[1.]] * 7, Qps=[[2.]] * 7)
+        self.population = pk.PopulationSolution(population, dosing,
+                                                nsteps=51)
+
+    def test_render_batch(self):
+        """
+        Tests rendering solutions and a population to PDF and PNG pages.
+        """
+        figures = (sys.modules['matplotlib.pyplot'].get_fignums()
+                   if 'matplotlib.pyplot' in sys.modules else [])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'report.pdf')
+            files = plotting.render_batch(
+                self.solutions + [self.population.result()], path, rows=2,
+                cols=2)
+            self.assertEqual(files, [path])
+            with open(path, 'rb') as f:
+                pages = re.findall(rb'/Type ?/Page\b', f.read())
+            self.assertEqual(len(pages), 3)
+
+            path = os.path.join(directory, 'report.png')
+            for processes in [1, 2]:
+                files = plotting.render_batch(self.population, path, rows=2,
+                                              cols=2, processes=processes)
+                self.assertEqual([os.path.basename(f) for f in files],
+                                 ['report-001.png', 'report-002.png'])
+                for f in files:
+                    self.assertTrue(os.path.getsize(f) > 0)
+                    os.remove(f)
+
+            with self.assertRaises(ValueError):
+                plotting.render_batch(self.solutions, path, titles=['a'])
+            with self.assertRaises(ValueError):
+                plotting.render_batch(self.solutions, path[:-4] + '.svg')
+        if 'matplotlib.pyplot' in sys.modules:
+            self.assertEqual(
+                sys.modules['matplotlib.pyplot'].get_fignums(), figures)
+
+    def test_decimate(self):
+        """
+        Tests decimation keeps the extremes of every curve.
+        """
+        t = np.linspace(0, 1, 100001)
+        y = np.array([np.sin(40 * t), np.zeros_like(t)])
+        y[1, 54321] = 5.
+        td, yd = plotting.decimate(t, y, 100)
+        self.assertEqual(td.shape, (2, 202))
+        self.assertTrue(np.all(np.diff(td, axis=1) >= 0))
+        np.testing.assert_array_equal(yd.max(axis=1), y.max(axis=1))
+        np.testing.assert_array_equal(yd.min(axis=1), y.min(axis=1))
+        self.assertEqual(td[1, np.argmax(yd[1])], t[54321])
+        np.testing.assert_array_equal(td[:, [0, -1]], [[0, 1], [0, 1]])
+        # short curves are unchanged
+        td, yd = plotting.decimate(t[:10], y[:, :10], 100)
+        np.testing.assert_array_equal(yd, y[:, :10])
+
+        model = pk.Model(Vc=2., Vps=[4.], Qps=[1.], CL=1.)
+        dosing = pk.Protocol(dose_times=[0, 0.5], instant_doses=[1., 2.])
+        solution = pk.Solution(model, dosing, nsteps=200001, engine='exact')
+        fig = solution.plot()
+        for line in fig.axes[0].get_lines():
+            self.assertLess(len(line.get_xdata()), 2000)
+        self.assertEqual(max(fig.axes[0].get_lines()[0].get_ydata()),
+                         solution.sol.y[0].max())
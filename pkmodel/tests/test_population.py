@@ -0,0 +1,100 @@
+import unittest
+import pkmodel as pk
+import numpy as np
+
+
+class PopulationTest(unittest.TestCase):
+    """
+    Tests the :class:`Population` and :class:`PopulationSolution` classes.
+    """
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.models = [
+            pk.Model(Vc=rng.uniform(1, 3), Vps=rng.uniform(1, 5, 2),
+                     Qps=rng.uniform(0.5, 3, 2), CL=rng.uniform(0.5, 2))
+            for _ in range(4)]
+        self.protocols = [
+            pk.Protocol(dose_amount=i + 1., subcutaneous=True, k_a=0.3 + i,
+                        continuous=True, continuous_period=[i, i + 1.5],
+                        instantaneous=True, dose_times=[0.5 * i, 3.],
+                        instant_doses=[1., 2.])
+            for i in range(4)]
+
+    def test_create(self):
+        """
+        Tests Population creation.
+        """
+        population = pk.Population.from_models(self.models)
+        self.assertEqual(len(population), 4)
+        self.assertEqual(population.size, 3)
+        self.assertEqual(population.Vps.shape, (4, 2))
+
+        population = pk.Population(Vc=[1., 2.], CL=1.)
+        self.assertEqual(population.size, 1)
+        np.testing.assert_array_equal(population.CL, [1., 1.])
+        with self.assertRaises(ValueError):
+            pk.Population(Vc=[1.], CL=[1.], Vps=[[1., 2.]], Qps=[[1.]])
+
+    def test_matches_solution(self):
+        """
+        Tests the stacked solution matches solving each subject on its own,
+        for both engines.
+        """
+        population = pk.Population.from_models(self.models)
+        for engine in ['exact', 'ode']:
+            result = pk.PopulationSolution(population, self.protocols,
+                                           tmax=6, nsteps=61, engine=engine)
+            self.assertEqual(result.y.shape, (4, 4, 61))
+            for i in range(4):
+                single = pk.Solution(self.models[i], self.protocols[i],
+                                     tmax=6, nsteps=61, engine='exact')
+                np.testing.assert_allclose(result.y[i], single.sol.y,
+                                           rtol=1e-2, atol=1e-3)
+
+    def test_ode_methods(self):
+        """
+        Tests the ode engine at tight tolerances, including LSODA with its
+        banded Jacobian, matches the exact engine.
+        """
+        population = pk.Population.from_models(self.models)
+        exact = pk.PopulationSolution(population, self.protocols, tmax=6,
+                                      nsteps=61)
+        for method in ['RK45', 'Radau', 'LSODA']:
+            ode = pk.PopulationSolution(population, self.protocols, tmax=6,
+                                        nsteps=61, engine='ode',
+                                        method=method, rtol=1e-9,
+                                        atol=1e-11)
+            np.testing.assert_allclose(ode.y, exact.y, rtol=1e-6,
+                                       atol=1e-8)
+
+    def test_shared_protocol(self):
+        """
+        Tests a single protocol is used for all subjects and that k_a can
+        be given per subject.
+        """
+        population = pk.Population.from_models(self.models,
+                                               k_a=[1., 2., 3., 4.])
+        result = pk.PopulationSolution(population, self.protocols[0],
+                                       tmax=2, nsteps=11)
+        self.protocols[0].k_a = 3.
+        single = pk.Solution(self.models[2], self.protocols[0], tmax=2,
+                             nsteps=11, engine='exact')
+        np.testing.assert_allclose(result.y[2], single.sol.y, atol=1e-12)
+
+        self.protocols[1].subcutaneous = False
+        with self.assertRaises(ValueError):
+            pk.PopulationSolution(population, self.protocols)
+
+    def test_repeated_eigenvalue(self):
+        """
+        Tests subjects whose k_a is minus the elimination rate.
+        """
+        population = pk.Population(Vc=[1., 2.], CL=1., k_a=[1., 0.5])
+        result = pk.PopulationSolution(population,
+                                       pk.Protocol(subcutaneous=True),
+                                       tmax=4, nsteps=9)
+        t = result.t_eval
+        for i, k_a in enumerate([1., 0.5]):
+            np.testing.assert_allclose(
+                result.y[i], [k_a * t * np.exp(-k_a * t), np.exp(-k_a * t)],
+                rtol=1e-12, atol=1e-15)
@@ -0,0 +1,99 @@
+import unittest
+import pkmodel as pk
+import numpy as np
+import scipy.integrate
+import scipy.linalg
+from pkmodel.model import compartment_matrix
+from pkmodel.propagator import propagator
+
+
+class PropagatorTest(unittest.TestCase):
+    """
+    Tests the :class:`Propagator` class and the exact solution engine.
+    """
+    def test_single_bolus(self):
+        """
+        Tests a bolus into one compartment decays exponentially.
+        """
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=3.)
+        dosing = pk.Protocol(instantaneous=True, dose_times=[0],
+                             instant_doses=[5.])
+        solution = pk.Solution(model, dosing, tmax=2, nsteps=50,
+                               engine='exact')
+        np.testing.assert_allclose(solution.sol.y[0],
+                                   5. * np.exp(-1.5 * solution.t_eval))
+
+    def test_matches_ode(self):
+        """
+        Tests the exact solution against a tightly integrated ODE, for
+        intravenous and subcutaneous infusions.
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 0.5], CL=1.)
+        for subcutaneous in [False, True]:
+            dosing = pk.Protocol(dose_amount=4., subcutaneous=subcutaneous,
+                                 k_a=0.7, continuous=True,
+                                 continuous_period=[0.5, 2.],
+                                 instantaneous=True, dose_times=[1.],
+                                 instant_doses=[3.])
+            k_a = 0.7 if subcutaneous else None
+            t = np.linspace(0, 4, 41)
+            y = propagator(model, k_a).solve(dosing.schedule(4), t)
+
+            A, b = compartment_matrix(model, k_a)
+            y0 = np.zeros(len(b))
+            pieces = [(0, 0.5, 0, 0), (0.5, 1., 4., 0), (1., 2., 4., 3.),
+                      (2., 4.01, 0, 0)]
+            for start, stop, rate, bolus in pieces:
+                y0 = y0 + bolus * b
+                ode = scipy.integrate.solve_ivp(
+                    lambda _, q: A @ q + b * rate, [start, stop], y0,
+                    dense_output=True, rtol=1e-10, atol=1e-12)
+                mask = (t >= start) & (t < stop)
+                np.testing.assert_allclose(y[:, mask], ode.sol(t[mask]),
+                                           atol=1e-7)
+                y0 = ode.y[:, -1]
+
+    def test_cache(self):
+        """
+        Tests the decomposition is reused for equal parameters only.
+        """
+        model = pk.Model(Vc=2., Vps=[1.], Qps=[3.], CL=1.)
+        first = propagator(model)
+        self.assertIs(propagator(model), first)
+        model.add_compartment(2., 2.)
+        self.assertIsNot(propagator(model), first)
+        self.assertEqual(propagator(model).size, 3)
+
+    def test_repeated_eigenvalue(self):
+        """
+        Tests subcutaneous dosing when -k_a is an eigenvalue of the
+        intravenous part, where the transfer matrix cannot be diagonalised,
+        and close to one.
+        """
+        solution = pk.Solution(pk.Model(1, [], [], 1),
+                               pk.Protocol(subcutaneous=True),
+                               engine='exact')
+        t = solution.t_eval
+        np.testing.assert_allclose(solution.sol.y,
+                                   [t * np.exp(-t), np.exp(-t)],
+                                   rtol=1e-12, atol=1e-15)
+
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 0.5], CL=1.)
+        A_iv, _ = compartment_matrix(model)
+        eigenvalue = np.sort(np.linalg.eigvals(A_iv).real)[1]
+        t = np.linspace(0, 5, 11)
+        schedule = (np.array([0., 1.]), np.array([2., 1.]),
+                    np.array([0.5, 0.]))
+        for k_a in [-eigenvalue, -eigenvalue * (1 + 1e-9)]:
+            A, b = compartment_matrix(model, k_a)
+            expected = np.empty((4, len(t)))
+            for i, time in enumerate(t):
+                # the doses as states of an augmented system
+                first = scipy.linalg.expm(np.block([
+                    [A, b[:, None]], [np.zeros((1, 5))]]) * min(time, 1.))
+                q = first[:4] @ np.append(2. * b, 0.5)
+                if time >= 1.:
+                    q = scipy.linalg.expm(A * (time - 1.)) @ (q + b)
+                expected[:, i] = q
+            y = propagator(model, k_a).solve(schedule, t)
+            np.testing.assert_allclose(y, expected, rtol=1e-9, atol=1e-12)
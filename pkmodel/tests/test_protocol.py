@@ -94,3 +94,105 @@ class ProtocolTest(unittest.TestCase):
         self.assertEqual(dosing.instantaneous, True)
         self.assertEqual(dosing.dose_times, [1, 5])
         self.assertEqual(dosing.instant_doses, [1, 1])
+
+    def test_schedule(self):
+        dosing = pk.Protocol(dose_amount=10, continuous=True,
+                             continuous_period=[1, 2],
+                             instantaneous=True, instant_doses=[10, 20, 30],
+                             dose_times=[1.5, 0.5, 5])
+        times, boluses, rates = dosing.schedule(4)
+        np.testing.assert_array_equal(times, [0, 0.5, 1, 1.5, 2])
+        np.testing.assert_array_equal(boluses, [0, 20, 0, 10, 0])
+        np.testing.assert_array_equal(rates, [0, 0, 10, 10, 0])
+
+        dosing.instantaneous = False
+        times, boluses, rates = dosing.schedule(4)
+        np.testing.assert_array_equal(times, [0, 1, 2])
+        np.testing.assert_array_equal(boluses, [0, 0, 0])
+
+    def test_vectorised_dose(self):
+        dosing = pk.Protocol(dose_amount=10, continuous=True,
+                             continuous_period=[1, 2], instantaneous=True,
+                             instant_doses=[10, 20, 30],
+                             dose_times=[1.5, 0.5, 1.51])
+        t = np.linspace(-1, 4, 5001)
+        expected = np.where((t >= 1) & (t < 2), 10., 0.)
+        for time, dose in [(1.5, 10), (0.5, 20), (1.51, 30)]:
+            expected += pk.protocol.easy_gaus(t, time, 0.02) * dose
+        np.testing.assert_allclose(dosing.dose_time_function(t), expected,
+                                   atol=1e-12)
+        self.assertEqual(dosing.dose_time_function(t[:, None].T).shape,
+                         (1, 5001))
+        self.assertAlmostEqual(dosing.dose_time_function(t[3000]),
+                               expected[3000])
+
+        dosing.add_dose(3, 5)
+        self.assertGreater(dosing.dose_time_function(3.), 90)
+        dosing.instantaneous = False
+        self.assertEqual(dosing.dose_time_function(3.), 0)
+
+    def test_regimen(self):
+        regimen = pk.Protocol(dose_times=[5.5], instant_doses=[2.],
+                              instantaneous=False)
+        regimen.add_regimen(start=1, interval=8, count=4, amount=3.)
+        regimen.add_regimen(start=9, interval=12, count=2, amount=1.)
+        self.assertTrue(regimen.instantaneous)
+        self.assertEqual(len(regimen.regimens), 2)
+        expanded = pk.Protocol(dose_times=[5.5, 1, 9, 17, 25, 9, 21],
+                               instant_doses=[2., 3, 3, 3, 3, 1, 1])
+
+        for actual, expected in zip(regimen.schedule(30),
+                                    expanded.schedule(30)):
+            np.testing.assert_array_equal(actual, expected)
+        times, doses = regimen.doses_between(8, 22)
+        np.testing.assert_array_equal(times, [9, 9, 17, 21])
+        np.testing.assert_array_equal(doses, [3, 1, 3, 1])
+        t = np.linspace(0, 30, 3001)
+        np.testing.assert_allclose(regimen.dose_time_function(t),
+                                   expanded.dose_time_function(t))
+
+        self.assertEqual(regimen.next_dose(2), (5.5, 2.))
+        self.assertEqual(regimen.next_dose(6), (9., 4.))
+        self.assertEqual(regimen.next_dose(25), (25., 3.))
+        self.assertIsNone(regimen.next_dose(25.5))
+        self.assertEqual(regimen.active_dose(20), (17., 3.))
+        self.assertEqual(regimen.active_dose(100), (25., 3.))
+        self.assertIsNone(regimen.active_dose(0.5))
+        self.assertNotEqual(regimen.snapshot(), expanded.snapshot())
+
+        with self.assertRaises(ValueError):
+            regimen.add_regimen(0, 0, 1, 1)
+
+    def test_nearest_dose(self):
+        dosing = pk.Protocol(dose_times=[2., 1., 2., 3.],
+                             instant_doses=[1., 2., 3., 4.])
+        self.assertEqual(dosing.next_dose(1.5), (2., 4.))
+        self.assertEqual(dosing.active_dose(2.5), (2., 4.))
+        self.assertEqual(dosing.next_dose(1.), (1., 2.))
+        self.assertIsNone(dosing.active_dose(0.5))
+
+    def test_regimen_rounding(self):
+        regimen = pk.Protocol(dose_times=[], instant_doses=[])
+        regimen.add_regimen(0, 0.1, 100, 1.)
+        self.assertEqual(regimen.next_dose(3 * 0.1), (3 * 0.1, 1.))
+        self.assertEqual(regimen.next_dose(0.3), (3 * 0.1, 1.))
+        self.assertEqual(regimen.active_dose(0.7), (7 * 0.1, 1.))
+        times, _ = regimen.doses_between(3 * 0.1, 0.5)
+        np.testing.assert_array_equal(times, [3 * 0.1, 4 * 0.1])
+        times, _ = regimen.doses_between(0.3, 0.7)
+        np.testing.assert_array_equal(times, np.arange(3, 7) * 0.1)
+
+    def test_in_place_changes(self):
+        dosing = pk.Protocol(dose_times=[1.], instant_doses=[1.])
+        dosing.schedule(4)
+        dosing.dose_times.append(2.)
+        dosing.instant_doses.append(5.)
+        np.testing.assert_array_equal(dosing.schedule(4)[1], [0, 1, 5])
+        self.assertGreater(dosing.dose_time_function(2.), 90)
+        dosing.dose_times[1] = 3.
+        self.assertEqual(dosing.next_dose(1.5), (3., 5.))
+
+        dosing.regimens.append((0.5, 1., 2, 4.))
+        self.assertEqual(dosing.next_dose(0), (0.5, 4.))
+        del dosing.regimens[:]
+        self.assertEqual(dosing.next_dose(0), (1., 1.))
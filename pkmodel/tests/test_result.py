@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import pkmodel as pk
+
+
+class ResultTest(unittest.TestCase):
+    """
+    Tests the :class:`Result` class.
+    """
+    def setUp(self):
+        model = pk.Model(Vc=2., Vps=[4.], Qps=[1.], CL=1.)
+        dosing = pk.Protocol(dose_times=[0, 0.5], instant_doses=[1., 2.])
+        self.solution = pk.Solution(model, dosing, nsteps=11,
+                                    engine='exact')
+        population = pk.Population(Vc=[1., 2., 3.], CL=1., Vps=[[1.]] * 3,
+                                   Qps=[[2.]] * 3)
+        self.population = pk.PopulationSolution(population, dosing,
+                                                nsteps=11)
+
+    def test_create(self):
+        """
+        Tests results of a Solution and a PopulationSolution.
+        """
+        result = self.solution.result()
+        np.testing.assert_array_equal(result.y, self.solution.sol.y)
+        self.assertEqual(len(result), 11)
+        self.assertFalse(hasattr(result, '__dict__'))
+        result = self.population.result(dtype=np.float32)
+        self.assertEqual(result.y.shape, (3, 2, 11))
+        self.assertEqual(result.y.dtype, np.float32)
+        self.assertEqual(result.t.dtype, np.float32)
+        self.assertEqual(result.nbytes, 4 * (66 + 11))
+        with self.assertRaises(ValueError):
+            pk.Result([0., 1.], np.zeros((2, 3)))
+
+    def test_save_load(self):
+        """
+        Tests results are saved and memory mapped back.
+        """
+        result = self.population.result(dtype=np.float32)
+        with tempfile.TemporaryDirectory() as directory:
+            for name in ['result.npz', 'result']:
+                path = os.path.join(directory, name)
+                result.save(path)
+                loaded = pk.Result.load(path)
+                self.assertIsInstance(loaded.y, np.memmap)
+                np.testing.assert_array_equal(loaded.y, result.y)
+                np.testing.assert_array_equal(loaded.t, result.t)
+                self.assertEqual(loaded.y.dtype, np.float32)
+                with self.assertRaises(ValueError):
+                    loaded.y[0, 0, 0] = 1.
+                loaded = pk.Result.load(path, mmap_mode=None)
+                self.assertNotIsInstance(loaded.y, np.memmap)
+                np.testing.assert_array_equal(loaded.y, result.y)
+                del loaded
+
+            path = os.path.join(directory, 'compressed.npz')
+            np.savez_compressed(path, t=result.t, y=result.y)
+            with self.assertRaises(ValueError):
+                pk.Result.load(path)
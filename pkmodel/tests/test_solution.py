@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 import pkmodel as pk
 import numpy as np
 import matplotlib
@@ -22,7 +22,9 @@ class SolutionTest(unittest.TestCase):
         mock_model.Vps = [1]
         mock_protocol = Mock()
         mock_protocol.subcutaneous = False
-        mock_protocol.dose_time_function.return_value = 1
+        mock_protocol.schedule.return_value = (np.array([0.]),
+                                               np.array([0.]),
+                                               np.array([1.]))
 
         solution = pk.Solution(model=mock_model, protocol=mock_protocol)
         self.assertEqual(solution.sol.y.shape[0], solution.model.size)
@@ -43,7 +45,9 @@ class SolutionTest(unittest.TestCase):
         mock_protocol = Mock()
         mock_protocol.subcutaneous = True
         mock_protocol.k_a = 1
-        mock_protocol.dose_time_function.return_value = 1
+        mock_protocol.schedule.return_value = (np.array([0.]),
+                                               np.array([0.]),
+                                               np.array([1.]))
 
         solution = pk.Solution(model=mock_model, protocol=mock_protocol)
         self.assertEqual(solution.sol.y.shape[0], solution.model.size + 1)
@@ -63,7 +67,9 @@ class SolutionTest(unittest.TestCase):
         mock_model.Vps = [1]
         mock_protocol = Mock()
         mock_protocol.subcutaneous = False
-        mock_protocol.dose_time_function.return_value = 1
+        mock_protocol.schedule.return_value = (np.array([0.]),
+                                               np.array([0.]),
+                                               np.array([1.]))
 
         solution = pk.Solution(model=mock_model, protocol=mock_protocol)
 
@@ -82,10 +88,199 @@ class SolutionTest(unittest.TestCase):
         mock_model.Vps = [1]
         mock_protocol = Mock()
         mock_protocol.subcutaneous = False
-        mock_protocol.dose_time_function.return_value = 1
+        mock_protocol.schedule.return_value = (np.array([0.]),
+                                               np.array([0.]),
+                                               np.array([1.]))
 
         solution = pk.Solution(model=mock_model, protocol=mock_protocol)
 
         sol_fig = solution.generate_plot(separate=True)
         self.assertIsInstance(sol_fig, matplotlib.figure.Figure)
 
+    def test_stiff_methods(self):
+        """
+        Tests the implicit solvers with the analytic Jacobian agree with
+        the default Runge-Kutta solver.
+        """
+        model = pk.Model(Vc=1., Vps=[1., 2.], Qps=[100., 50.], CL=0.1)
+        protocol = pk.Protocol(dose_amount=1, continuous=True,
+                               continuous_period=[0, 1],
+                               instantaneous=False, dose_times=[])
+        reference = pk.Solution(model, protocol, nsteps=100)
+        self.assertEqual(pk.Solution(model, protocol, nsteps=100,
+                                     method='BDF').sol.njev, 0)
+        for method in ['BDF', 'Radau', 'LSODA']:
+            solution = pk.Solution(model, protocol, nsteps=100,
+                                   method=method)
+            np.testing.assert_allclose(solution.sol.y, reference.sol.y,
+                                       rtol=1e-2, atol=1e-3)
+        np.testing.assert_array_equal(
+            solution.jac_sparsity,
+            [[True, True, True], [True, True, False], [True, False, True]])
+
+        with self.assertRaises(ValueError):
+            pk.Solution(model, protocol, method='Euler')
+
+    def test_dose_events(self):
+        """
+        Tests boluses are applied as jumps between integrated segments, so
+        the numerical solution agrees with the exact one and long horizons
+        do not need small steps.
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 0.5], CL=1.)
+        dosing = pk.Protocol(dose_amount=2., subcutaneous=True, k_a=0.5,
+                             continuous=True, continuous_period=[10, 30],
+                             instantaneous=True,
+                             dose_times=list(range(0, 336, 12)),
+                             instant_doses=[5.] * 28)
+        ode = pk.Solution(model, dosing, tmax=336, nsteps=100000)
+        exact = pk.Solution(model, dosing, tmax=336, nsteps=100000,
+                            engine='exact')
+        np.testing.assert_allclose(ode.sol.y, exact.sol.y, atol=1e-2)
+        self.assertLess(ode.sol.nfev, 10000)
+
+    def test_tolerances(self):
+        """
+        Tests rtol and atol set the accuracy of the ode engine and are part
+        of the fingerprint.
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 0.5], CL=1.)
+        dosing = pk.Protocol(subcutaneous=True, k_a=0.5, continuous=True,
+                             continuous_period=[1, 3], dose_times=[0, 5])
+        exact = pk.Solution(model, dosing, tmax=10, nsteps=101,
+                            engine='exact').sol.y
+        loose = pk.Solution(model, dosing, tmax=10, nsteps=101)
+        tight = pk.Solution(model, dosing, tmax=10, nsteps=101, rtol=1e-10,
+                            atol=1e-12)
+        np.testing.assert_allclose(tight.sol.y, exact, rtol=1e-8,
+                                   atol=1e-10)
+        self.assertGreater(np.abs(loose.sol.y - exact).max(), 1e-6)
+        self.assertNotEqual(loose.fingerprint(), tight.fingerprint())
+        self.assertGreater(tight.sol.nfev, loose.sol.nfev)
+
+    def test_at(self):
+        """
+        Tests evaluating the solution at arbitrary times without solving
+        again, for both engines.
+        """
+        model = pk.Model(Vc=2., Vps=[4.], Qps=[1.], CL=1.)
+        dosing = pk.Protocol(dose_amount=1., continuous=True,
+                             continuous_period=[1, 3], instantaneous=True,
+                             dose_times=[0, 2], instant_doses=[1., 2.])
+        times = [7.5, 0.25, 2., 1.9, 0.]
+        for engine in ['ode', 'exact']:
+            solution = pk.Solution(model, dosing, tmax=8, nsteps=33,
+                                   engine=engine)
+            np.testing.assert_allclose(solution.at(solution.t_eval),
+                                       solution.sol.y)
+            np.testing.assert_allclose(solution.at(times)[:, 1],
+                                       solution.sol.y[:, 1])
+            self.assertEqual(solution.at(times).shape, (2, 5))
+            self.assertEqual(solution.at(4.).shape, (2,))
+            self.assertEqual(solution.at([]).shape, (2, 0))
+            self.assertEqual(solution.concentration([]).shape, (2, 0))
+            # the dose at t=2 is included at t=2
+            self.assertGreater(solution.at(2.)[0], solution.at(1.9)[0] + 1)
+            np.testing.assert_allclose(solution.concentration(times),
+                                       solution.at(times) / [[2.], [4.]])
+            with self.assertRaises(ValueError):
+                solution.at([1, 9])
+        ode = pk.Solution(model, dosing, tmax=8)
+        np.testing.assert_allclose(solution.at(times), ode.at(times),
+                                   rtol=1e-3, atol=1e-5)
+
+    def test_lazy_solve(self):
+        """
+        Tests the solution is computed once, on first access, and only
+        recomputed after the model or protocol changed.
+        """
+        model = pk.Model(Vc=2., Vps=[4.], Qps=[1.], CL=1.)
+        dosing = pk.Protocol(dose_times=[0], instant_doses=[1.])
+        solution = pk.Solution(model, dosing, nsteps=11, cache=False)
+        solution2 = pk.Solution(model, dosing, nsteps=11, cache=False)
+        with patch.object(pk.Solution, 'solver',
+                          autospec=True,
+                          side_effect=pk.Solution.solver) as solver:
+            sol = solution.sol
+            self.assertIs(solution.sol, sol)
+            self.assertEqual(solver.call_count, 1)
+            solution.generate_plot(compare=solution2, separate=True)
+            solution.generate_plot(compare=solution2)
+            solution.at([0.5])
+            self.assertEqual(solver.call_count, 2)
+
+            dosing.add_dose(0.5, 1.)
+            self.assertIsNot(solution.sol, sol)
+            model.add_compartment(1., 1.)
+            self.assertEqual(solution.sol.y.shape, (3, 11))
+            self.assertEqual(solver.call_count, 4)
+
+    def test_sensitivities(self):
+        """
+        Tests the forward sensitivities against central finite differences.
+        """
+        params = {'Vc': 2., 'CL': 1., 'Vps': [4.], 'Qps': [1.]}
+        dosing = pk.Protocol(dose_times=[0, 1], instant_doses=[1., 2.],
+                             subcutaneous=True, k_a=2.)
+        solution = pk.Solution(pk.Model(**params), dosing, tmax=3, nsteps=31,
+                               method='Radau', sensitivities=True)
+        self.assertEqual(solution.sol.y.shape, (3, 31))
+        self.assertEqual(solution.sol.parameter_names,
+                         ['Vc', 'CL', 'Vp1', 'Qp1', 'k_a'])
+        self.assertEqual(solution.sol.sensitivities.shape, (5, 3, 31))
+        self.assertEqual(solution.at(1.5).shape, (3,))
+        self.assertEqual(solution.sensitivity_at(1.5).shape, (5, 3))
+        self.assertEqual(solution.sensitivity_at([]).shape, (5, 3, 0))
+        np.testing.assert_allclose(
+            solution.sensitivity_at(solution.sol.t),
+            solution.sol.sensitivities)
+
+        h = 1e-5
+        for j, name in enumerate(solution.sol.parameter_names):
+            ys = []
+            for sign in [1, -1]:
+                values = dict(params, Vps=list(params['Vps']),
+                              Qps=list(params['Qps']))
+                protocol = pk.Protocol(dose_times=[0, 1],
+                                       instant_doses=[1., 2.],
+                                       subcutaneous=True, k_a=2.)
+                if name == 'k_a':
+                    protocol.k_a += sign * h
+                elif name[:2] in ('Vp', 'Qp'):
+                    values[name[:2] + 's'][0] += sign * h
+                else:
+                    values[name] += sign * h
+                ys.append(pk.Solution(pk.Model(**values), protocol, tmax=3,
+                                      nsteps=31, engine='exact').sol.y)
+            np.testing.assert_allclose(solution.sol.sensitivities[j],
+                                       (ys[0] - ys[1]) / (2 * h),
+                                       rtol=1e-2, atol=1e-3)
+
+        with self.assertRaises(ValueError):
+            pk.Solution(pk.Model(**params), dosing, engine='exact',
+                        sensitivities=True)
+
+    def test_stream(self):
+        """
+        Tests the streamed blocks concatenate to the full solution, with
+        doses on and between the chunk boundaries.
+        """
+        model = pk.Model(Vc=2., Vps=[4., 1.], Qps=[1., 2.], CL=1.)
+        dosing = pk.Protocol(dose_times=[0, 0.3, 0.5],
+                             instant_doses=[1., 2., 1.], subcutaneous=True,
+                             k_a=2.)
+        dosing.make_continuous(0.2, 0.7)
+        dosing.add_regimen(0.8, 0.1, 3, 1.)
+        for engine, tolerance in [('exact', 1e-12), ('ode', 1e-2)]:
+            solution = pk.Solution(model, dosing, tmax=2, nsteps=21,
+                                   engine=engine, cache=False)
+            blocks = list(solution.stream(chunk_size=5))
+            self.assertEqual([len(t) for t, _ in blocks], [5, 5, 5, 5, 1])
+            self.assertIsNone(solution._sol)
+            np.testing.assert_array_equal(
+                np.concatenate([t for t, _ in blocks]), solution.t_eval)
+            np.testing.assert_allclose(
+                np.concatenate([y for _, y in blocks], axis=1),
+                solution.sol.y, rtol=tolerance, atol=tolerance)
+        with self.assertRaises(ValueError):
+            next(solution.stream(chunk_size=0))
@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import Mock, patch
+import pkmodel as pk
+import scipy.integrate
+
+
+class StatsTest(unittest.TestCase):
+    """
+    Tests the :mod:`stats` module and the statistics of Solution.
+    """
+    def setUp(self):
+        self.model = pk.Model(Vc=2., Vps=[4.], Qps=[1.], CL=1.)
+        self.dosing = pk.Protocol(dose_times=[0, 0.5],
+                                  instant_doses=[1., 2.])
+
+    def test_ode(self):
+        """
+        Tests the statistics of the ode engine.
+        """
+        solution = pk.Solution(self.model, self.dosing, cache=False)
+        self.assertIsNone(solution.stats)
+        solution.sol
+        stats = solution.stats
+        self.assertFalse(stats.cached)
+        self.assertEqual(stats.segments, 2)
+        self.assertEqual(stats.dose_calls, 1)
+        self.assertEqual(stats.rhs_calls, solution.sol.nfev)
+        self.assertGreater(stats.steps, 0)
+        self.assertGreaterEqual(stats.rejected_steps, 0)
+        for phase in [stats.setup, stats.integration, stats.output]:
+            self.assertGreaterEqual(phase, 0)
+        self.assertAlmostEqual(stats.total, stats.as_dict()['total'])
+        self.assertIn('rhs_calls=', repr(stats))
+
+        solution = pk.Solution(self.model, self.dosing, method='Radau',
+                               cache=False)
+        solution.sol
+        self.assertIsNone(solution.stats.rejected_steps)
+        self.assertGreater(solution.stats.lu_decompositions, 0)
+
+    def test_counts(self):
+        """
+        Tests the right hand side calls and rejected steps against counts
+        of the calls themselves, on a stiff model that rejects steps.
+        """
+        model = pk.Model(Vc=2., Vps=[4.], Qps=[200.], CL=1.)
+        solution = pk.Solution(model, self.dosing, tmax=5, cache=False)
+        rhs = Mock(wraps=solution.rhs_intravenous)
+        solution.rhs_intravenous = rhs
+        # every attempted step of RK45 calls rk_step once
+        attempts = Mock(wraps=scipy.integrate._ivp.rk.rk_step)
+        with patch('scipy.integrate._ivp.rk.rk_step', attempts):
+            solution.sol
+        stats = solution.stats
+        self.assertEqual(stats.rhs_calls, rhs.call_count)
+        self.assertGreater(stats.rejected_steps, 0)
+        self.assertEqual(stats.steps + stats.rejected_steps,
+                         attempts.call_count)
+
+    def test_exact(self):
+        """
+        Tests the statistics of the exact engine and of cache hits.
+        """
+        solution = pk.Solution(self.model, self.dosing, engine='exact',
+                               nsteps=17, cache=True)
+        solution.sol
+        self.assertEqual(solution.stats.rhs_calls, 0)
+        self.assertEqual(solution.stats.segments, 2)
+        again = pk.Solution(self.model, self.dosing, engine='exact',
+                            nsteps=17, cache=True)
+        again.sol
+        self.assertTrue(again.stats.cached)
+        self.assertEqual(again.stats.total, 0)
+
+    def test_hooks(self):
+        """
+        Tests global and per solution hooks receive the statistics.
+        """
+        hook, local = Mock(), Mock()
+        pk.stats.add_hook(hook)
+        try:
+            solution = pk.Solution(self.model, self.dosing, cache=False,
+                                   hooks=[local])
+            solution.sol
+            hook.assert_called_once_with(solution, solution.stats)
+            local.assert_called_once_with(solution, solution.stats)
+        finally:
+            pk.stats.remove_hook(hook)
+        pk.Solution(self.model, self.dosing, cache=False).sol
+        self.assertEqual(hook.call_count, 1)
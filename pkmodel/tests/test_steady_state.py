@@ -0,0 +1,72 @@
+import unittest
+import pkmodel as pk
+import numpy as np
+
+
+class SteadyStateTest(unittest.TestCase):
+    """
+    Tests the :class:`SteadyState` class.
+    """
+    def test_one_compartment(self):
+        """
+        Tests the textbook steady state of intravenous boluses.
+        """
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        dosing = pk.Protocol(dose_times=[], instant_doses=[])
+        dosing.add_regimen(start=0, interval=4., count=1, amount=10.)
+        steady = pk.SteadyState(model, dosing, nsteps=41)
+        k = 0.5
+        R = 1 / (1 - np.exp(-k * 4.))
+        np.testing.assert_allclose(steady.peak, [5. * R])
+        np.testing.assert_allclose(steady.trough, [5. * R * np.exp(-2.)])
+        np.testing.assert_allclose(steady.average, [10. / (1. * 4.)])
+        np.testing.assert_allclose(steady.accumulation_ratio, [R])
+        np.testing.assert_allclose(steady.time_of_peak, [0.])
+        self.assertEqual(steady.y.shape, (1, 41))
+
+    def test_matches_simulation(self):
+        """
+        Tests the steady state matches a long simulation, for subcutaneous
+        dosing with peripheral compartments.
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 0.5], CL=1.)
+        dosing = pk.Protocol(subcutaneous=True, k_a=0.8, dose_times=[],
+                             instant_doses=[])
+        dosing.add_regimen(start=0, interval=6., count=100, amount=5.)
+        steady = pk.SteadyState(model, dosing, nsteps=13)
+        solution = pk.Solution(model, dosing, tmax=600., engine='exact')
+        # the next dose is given at the end of the interval
+        np.testing.assert_allclose(steady.y[:, :-1],
+                                   solution.at(540. + steady.t[:-1]),
+                                   rtol=1e-8)
+        self.assertTrue(np.all(steady.peak >= steady.average))
+        self.assertTrue(np.all(steady.average >= steady.trough))
+
+    def test_repeated_eigenvalue(self):
+        """
+        Tests subcutaneous dosing with k_a equal to the elimination rate,
+        against the sum of the responses to the past doses.
+        """
+        model = pk.Model(Vc=1., Vps=[], Qps=[], CL=1.)
+        dosing = pk.Protocol(subcutaneous=True, k_a=1., dose_times=[],
+                             instant_doses=[])
+        dosing.add_regimen(start=0, interval=2., count=1, amount=1.)
+        steady = pk.SteadyState(model, dosing, nsteps=5)
+        t = steady.t + 2. * np.arange(100)[:, None]
+        np.testing.assert_allclose(
+            steady.y, [np.sum(t * np.exp(-t), axis=0),
+                       np.sum(np.exp(-t), axis=0)], rtol=1e-12)
+        # the area under one interval at steady state is the dose over CL
+        np.testing.assert_allclose(steady.average, [1. / 2.])
+
+    def test_errors(self):
+        """
+        Tests protocols without one regimen or models without clearance.
+        """
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        with self.assertRaises(ValueError):
+            pk.SteadyState(model, pk.Protocol())
+        dosing = pk.Protocol()
+        dosing.add_regimen(0, 12, 10, 1.)
+        with self.assertRaises(ValueError):
+            pk.SteadyState(pk.Model(Vc=2., Vps=[], Qps=[], CL=0.), dosing)
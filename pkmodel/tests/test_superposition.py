@@ -0,0 +1,68 @@
+import unittest
+import pkmodel as pk
+import numpy as np
+
+
+class SuperpositionTest(unittest.TestCase):
+    """
+    Tests the :class:`Superposition` class.
+    """
+    def test_matches_exact(self):
+        """
+        Tests the convolution matches the exact engine on the grid, with
+        doses and infusion changes between grid points.
+        """
+        model = pk.Model(Vc=2., Vps=[1., 4.], Qps=[3., 0.5], CL=1.)
+        for subcutaneous in [False, True]:
+            superposition = pk.Superposition(model, tmax=24, nsteps=97,
+                                             subcutaneous=subcutaneous,
+                                             k_a=0.7)
+            protocols = []
+            for i in range(3):
+                protocol = pk.Protocol(
+                    dose_amount=2. + i, subcutaneous=subcutaneous, k_a=0.7,
+                    continuous=True, continuous_period=[1.1 * i, 5.03],
+                    dose_times=[0, 3.33 + i, 12.], instant_doses=[1, 2, 3])
+                protocol.add_regimen(14.1, 2.5 + i, 3, 1.5)
+                protocols.append(protocol)
+            y = superposition.solve_many(protocols)
+            self.assertEqual(y.shape, (3, 3 + subcutaneous, 97))
+            for i, protocol in enumerate(protocols):
+                exact = pk.Solution(model, protocol, tmax=24, nsteps=97,
+                                    engine='exact').sol.y
+                np.testing.assert_allclose(y[i], exact, atol=1e-10)
+                np.testing.assert_allclose(superposition.solve(protocol),
+                                           exact, atol=1e-10)
+
+    def test_responses(self):
+        """
+        Tests the unit impulse and step responses.
+        """
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        superposition = pk.Superposition(model, tmax=4, nsteps=5)
+        np.testing.assert_allclose(superposition.impulse_response[0],
+                                   np.exp(-0.5 * superposition.t_eval))
+        np.testing.assert_allclose(
+            superposition.step_response[0],
+            2 * (1 - np.exp(-0.5 * superposition.t_eval)))
+        with self.assertRaises(ValueError):
+            superposition.solve(pk.Protocol(subcutaneous=True))
+
+    def test_repeated_eigenvalue(self):
+        """
+        Tests subcutaneous dosing with k_a equal to the elimination rate.
+        """
+        model = pk.Model(Vc=2., Vps=[], Qps=[], CL=1.)
+        superposition = pk.Superposition(model, tmax=8, nsteps=33,
+                                         subcutaneous=True, k_a=0.5)
+        protocol = pk.Protocol(subcutaneous=True, k_a=0.5, continuous=True,
+                               continuous_period=[0.1, 3.03],
+                               dose_times=[0, 2.1], instant_doses=[1, 2])
+        exact = pk.Solution(model, protocol, tmax=8, nsteps=33,
+                            engine='exact').sol.y
+        np.testing.assert_allclose(superposition.solve(protocol), exact,
+                                   atol=1e-10)
+        t = superposition.t_eval
+        np.testing.assert_allclose(superposition.impulse_response,
+                                   [0.5 * t * np.exp(-0.5 * t),
+                                    np.exp(-0.5 * t)], atol=1e-14)
@@ -0,0 +1,62 @@
+import unittest
+import pkmodel as pk
+import numpy as np
+from pkmodel.cache import solution_cache
+
+
+class SweepTest(unittest.TestCase):
+    """
+    Tests the :class:`Sweep` class.
+    """
+    def setUp(self):
+        self.scenarios = []
+        for i in range(6):
+            model = pk.Model(Vc=1. + i, Vps=[1.] * (i % 3), Qps=[2.] * (i % 3),
+                             CL=1.)
+            protocol = pk.Protocol(dose_amount=1., subcutaneous=i % 2 == 1,
+                                   continuous=True, continuous_period=[0, 1],
+                                   instantaneous=False, dose_times=[])
+            self.scenarios.append((model, protocol))
+
+    def test_run(self):
+        """
+        Tests the parallel sweep matches solving each scenario in turn,
+        including padding of smaller models, over repeated runs.
+        """
+        with pk.Sweep(processes=2, chunksize=2, tmax=2, nsteps=21) as sweep:
+            result = sweep.run(self.scenarios)
+            again = sweep.run(self.scenarios[:3])
+        self.assertIsNone(sweep.pool)
+        self.assertEqual(result.shape, (6, 4, 21))
+        for i, (model, protocol) in enumerate(self.scenarios):
+            y = pk.Solution(model, protocol, tmax=2, nsteps=21).sol.y
+            np.testing.assert_allclose(result[i, :len(y)], y)
+            self.assertTrue(np.isnan(result[i, len(y):]).all())
+        np.testing.assert_array_equal(again, result[:3, :3])
+
+    def test_serial(self):
+        """
+        Tests a single process sweep runs without a pool.
+        """
+        solution_cache.clear()
+        sweep = pk.Sweep(processes=1, tmax=2, nsteps=21, engine='exact')
+        result = sweep.run(self.scenarios)
+        self.assertIsNone(sweep.pool)
+        self.assertEqual(len(solution_cache), 0)
+        model, protocol = self.scenarios[5]
+        y = pk.Solution(model, protocol, tmax=2, nsteps=21,
+                        engine='exact').sol.y
+        np.testing.assert_allclose(result[5, :len(y)], y)
+
+    def test_tolerances(self):
+        """
+        Tests rtol and atol are passed on to every Solution.
+        """
+        sweep = pk.Sweep(processes=1, tmax=2, nsteps=21, rtol=1e-10,
+                         atol=1e-12)
+        result = sweep.run(self.scenarios)
+        for i, (model, protocol) in enumerate(self.scenarios):
+            y = pk.Solution(model, protocol, tmax=2, nsteps=21,
+                            engine='exact').sol.y
+            np.testing.assert_allclose(result[i, :len(y)], y, rtol=1e-8,
+                                       atol=1e-10)
@@ -60,6 +60,11 @@ setup(
     # Packages to include
     packages=find_packages(include=('pkmodel', 'pkmodel.*')),
 
+    # Command line interface
+    entry_points={
+        'console_scripts': ['pkmodel=pkmodel.cli:main'],
+    },
+
     # List of dependencies
     install_requires=[
         # Dependencies go here!